@@ -1,6 +1,7 @@
 import argparse
 import datetime
 import dateutil.parser
+import pandas as pd
 
 import warsawbus
 
@@ -19,66 +20,291 @@ def initialize_parser():
     _parser.add_argument('--file', type=str, help='Data destination filename')
     _parser.add_argument('--start', type=str, help='Fetching start timestamp')
     _parser.add_argument('--end', type=str, help='Fetching end timestamp')
+    _parser.add_argument('--simplify', type=float,
+                         help='Simplify tracks - tolerance [km]')
+    _parser.add_argument('--adaptive', dest='adaptive', action='store_true',
+                         help='Fetch as often as the feed is updated')
+    _parser.add_argument('--max_staleness', type=float, default=60,
+                         help='Adaptive mode - maximum seconds between '
+                              'fetches')
+    _parser.add_argument('--geofence', type=float,
+                         help='Tag positions with the nearest stop - '
+                              'radius [km]')
+    _parser.add_argument('--schedules', type=str,
+                         help='Schedules filename providing stops for '
+                              'geofencing and simplification, stops are '
+                              'fetched from API otherwise')
+
+    # Add daemon sub parser
+    _parser = subparsers.add_parser('daemon',
+                                    help='Continuously fetch bus and tram '
+                                         'positions')
+    _parser.add_argument('--api_key', type=str, help='API key')
+    _parser.add_argument('--file', type=str,
+                         default='positions_{name}_{period}.csv',
+                         help='Data destination filename pattern')
+    _parser.add_argument('--step', type=float, default=15,
+                         help='Seconds between fetches')
+    _parser.add_argument('--end', type=str, help='Fetching end timestamp')
+    _parser.add_argument('--simplify', type=float,
+                         help='Simplify tracks - tolerance [km]')
+    _parser.add_argument('--schedules', type=str,
+                         help='Simplify mode - schedules filename providing '
+                              'stops, fetched from API otherwise')
+
+    # Add live map sub parser
+    _parser = subparsers.add_parser('live', help='Plot live bus speeds')
+    _parser.add_argument('--api_key', type=str, help='API key')
+    _parser.add_argument('--dir', type=str, help='Map destination directory')
+    _parser.add_argument('--end', type=str, help='Fetching end timestamp')
 
     # Add schedules sub parser
     _parser = subparsers.add_parser('schedules', help='Fetch bus schedules')
     _parser.add_argument('--api_key', type=str, help='API key')
     _parser.add_argument('--file', type=str, help='Data destination filename')
+    _parser.add_argument('--gtfs', type=str,
+                         help='GTFS feed filename, used instead of API')
+    _parser.add_argument('--date', type=str,
+                         help='Schedule date, when read from GTFS feed')
+
+    # Add store sub parser
+    _parser = subparsers.add_parser('store',
+                                    help='Convert positions to a trajectory '
+                                         'store')
+    _parser.add_argument('--file', type=str, help='Store destination directory')
+    _parser.add_argument('--positions', type=str, help='Positions filename')
+    _parser.add_argument('--simplify', type=float,
+                         help='Simplify tracks - tolerance [km]')
+    _parser.add_argument('--schedules', type=str,
+                         help='Simplify mode - schedules filename providing '
+                              'stops')
+    _parser.add_argument('--clean', dest='clean', action='store_true',
+                         help='Remove stale, future, out of Warsaw and '
+                              'impossible positions')
 
     # Add speed sub parser
     _parser = subparsers.add_parser('speeds', help='Calculate bus speeds')
     _parser.add_argument('--file', type=str, help='Data destination filename')
     _parser.add_argument('--positions', type=str, help='Positions filename')
+    _parser.add_argument('--clean', dest='clean', action='store_true',
+                         help='Remove stale, future, out of Warsaw and '
+                              'impossible positions')
     _parser.add_argument('--start', type=str, help='Fetching start timestamp')
     _parser.add_argument('--end', type=str, help='Fetching end timestamp')
     _parser.add_argument('--dry', dest='dry', action='store_true',
                          help='Dry run - just visualise data')
+    _parser.add_argument('--cache', type=str,
+                         help='Prepared plot data cache directory')
+    _parser.add_argument('--partition_cache', type=str,
+                         help='Hourly results cache directory')
+    _parser.add_argument('--fraction', type=float,
+                         help='Approximate mode - fraction of sampled '
+                              'vehicles of each line')
+
+    # Add arrivals sub parser
+    _parser = subparsers.add_parser('arrivals',
+                                    help='Find bus arrivals at stops')
+    _parser.add_argument('--file', type=str, help='Data destination filename')
+    _parser.add_argument('--schedules', type=str, help='Schedules filename')
+    _parser.add_argument('--positions', type=str, help='Positions filename')
+    _parser.add_argument('--clean', dest='clean', action='store_true',
+                         help='Remove stale, future, out of Warsaw and '
+                              'impossible positions')
 
     # Add delay sub parser
     _parser = subparsers.add_parser('delays', help='Calculate bus delays')
     _parser.add_argument('--file', type=str, help='Data destination filename')
     _parser.add_argument('--schedules', type=str, help='Schedules filename')
     _parser.add_argument('--positions', type=str, help='Positions filename')
+    _parser.add_argument('--arrivals', type=str,
+                         help='Arrivals filename, used instead of positions')
+    _parser.add_argument('--clean', dest='clean', action='store_true',
+                         help='Remove stale, future, out of Warsaw and '
+                              'impossible positions')
+    _parser.add_argument('--radii', type=str,
+                         help='Sweep mode - comma separated radii [km]')
+    _parser.add_argument('--time_thresholds', type=str,
+                         help='Sweep mode - comma separated minutes before '
+                              'planned arrival')
+    _parser.add_argument('--long', dest='long', action='store_true',
+                         help='Sweep mode - row per combination')
     _parser.add_argument('--start', type=str, help='Fetching start timestamp')
     _parser.add_argument('--end', type=str, help='Fetching end timestamp')
     _parser.add_argument('--dry', dest='dry', action='store_true',
                          help='Dry run - just visualise data')
+    _parser.add_argument('--cache', type=str,
+                         help='Prepared plot data cache directory')
+    _parser.add_argument('--partition_cache', type=str,
+                         help='Hourly results cache directory')
+    _parser.add_argument('--fraction', type=float,
+                         help='Approximate mode - fraction of sampled '
+                              'vehicles of each line')
 
     return parser
 
 
+def read_stops(args, radius):
+    if args.schedules:
+        return warsawbus.StopIndex.from_schedules(filename=args.schedules,
+                                                  radius=radius)
+    stops = warsawbus.ScheduleFetcher(api_key=args.api_key).fetch_stops()
+    return warsawbus.StopIndex.from_stops(stops=stops, radius=radius)
+
+
+def simplifier(args):
+    if not args.simplify:
+        return None
+    # positions in radius of stops are kept, so arrivals are not affected
+    radius = warsawbus.ArrivalCalculator.DISTANCE_THRESHOLD
+    return warsawbus.TrajectorySimplifier(tolerance=args.simplify,
+                                          stop_index=read_stops(args, radius))
+
+
+def stop_index(args):
+    if not args.geofence:
+        return None
+    return read_stops(args, args.geofence)
+
+
 def fetch_positions(args):
-    fetcher = warsawbus.PositionFetcher(api_key=args.api_key)
+    fetcher = warsawbus.PositionFetcher(api_key=args.api_key,
+                                        simplifier=simplifier(args),
+                                        stop_index=stop_index(args))
+    scheduler = None
+    if args.adaptive:
+        max_staleness = datetime.timedelta(seconds=args.max_staleness)
+        scheduler = warsawbus.FreshnessScheduler(max_staleness=max_staleness)
     fetcher.fetch_loop(
         start=dateutil.parser.parse(args.start),
         end=dateutil.parser.parse(args.end),
-        step=datetime.timedelta(seconds=15)
+        step=datetime.timedelta(seconds=15),
+        scheduler=scheduler,
     )
     fetcher.save(filename=args.file)
 
 
+def fetch_daemon(args):
+    step = datetime.timedelta(seconds=args.step)
+    # stops are read once for both fetchers
+    tracks_simplifier = simplifier(args)
+    fetchers = {
+        name: warsawbus.PositionFetcher(api_key=args.api_key,
+                                        vehicle_type=vehicle_type,
+                                        timeout=args.step,
+                                        simplifier=tracks_simplifier)
+        for name, vehicle_type in [('bus', warsawbus.PositionFetcher.BUS),
+                                   ('tram', warsawbus.PositionFetcher.TRAM)]
+    }
+    collector = warsawbus.Collector(fetchers=fetchers, step=step,
+                                    file_pattern=args.file)
+    collector.run(end=dateutil.parser.parse(args.end) if args.end else None)
+
+
+def plot_live(args):
+    step = datetime.timedelta(seconds=15)
+    fetcher = warsawbus.PositionFetcher(api_key=args.api_key,
+                                        timeout=step.total_seconds())
+    plotter = warsawbus.LivePlotter(dirname=args.dir, column_name='Speed',
+                                    interval=step.total_seconds())
+    plotter.write_page(filename='index.html',
+                       title='Warsaw buses live speed [km/h]',
+                       size=8, opacity=0.9, colorscale='speed')
+
+    latest = None
+
+    def publish(fetcher):
+        nonlocal latest
+        current = pd.DataFrame(fetcher.latest)
+        if latest is None:
+            latest = current.assign(Speed=float('nan'))
+        else:
+            latest = warsawbus.SpeedCalculator.get_speeds(latest, current)
+        plotter.publish(latest)
+
+    fetcher.fetch_loop(
+        start=datetime.datetime.now(),
+        end=dateutil.parser.parse(args.end),
+        step=step,
+        callback=publish,
+    )
+
+
 def fetch_schedules(args):
-    fetcher = warsawbus.ScheduleFetcher(api_key=args.api_key)
+    if args.gtfs:
+        date = dateutil.parser.parse(args.date) if args.date else \
+            datetime.datetime.now()
+        fetcher = warsawbus.GtfsScheduleFetcher(filename=args.gtfs,
+                                                date=date.date())
+    else:
+        fetcher = warsawbus.ScheduleFetcher(api_key=args.api_key)
     fetcher.fetch()
     fetcher.save(filename=args.file)
 
 
+def plot_cache(args):
+    if not args.cache:
+        return None
+    return warsawbus.PlotDataCache(dirname=args.cache)
+
+
+def cleaner(args):
+    if not args.clean:
+        return None
+    return warsawbus.PositionCleaner()
+
+
+def store_positions(args):
+    positions = warsawbus.Calculator.read_positions(args.positions,
+                                                    cleaner=cleaner(args))
+    if args.simplify:
+        positions = simplifier(args).simplify(positions)
+    store = warsawbus.TrajectoryStore.from_frame(positions)
+    store.save(dirname=args.file)
+
+
+def partition_cache(args):
+    if not args.partition_cache:
+        return None
+    return warsawbus.PartitionCache(dirname=args.partition_cache)
+
+
+def approximate(calculator, fraction, column_name):
+    calculator.sample(fraction)
+    calculator.calculate()
+    print(calculator.estimate(column_name))
+
+
 def calculate_speeds(args):
     if not args.dry:
         calculator = warsawbus.SpeedCalculator(
             positions_filename=args.positions,
             start=dateutil.parser.parse(args.start),
             end=dateutil.parser.parse(args.end),
+            cache=partition_cache(args),
+            cleaner=cleaner(args),
         )
+        if args.fraction is not None:
+            approximate(calculator, args.fraction, 'Speed')
+            return
         calculator.calculate()
         calculator.save(filename=args.file)
 
     plotter = warsawbus.WarsawPlotter(filename=args.file, column_name='Speed',
-                                      bounds=(30, 100))
+                                      bounds=(30, 100), cache=plot_cache(args))
     plotter.plot(filename='', title='Warsaw buses speed [km/h]',
                  size=5, opacity=0.9, colorscale='speed')
 
 
+def calculate_arrivals(args):
+    calculator = warsawbus.ArrivalCalculator(
+        schedules_filename=args.schedules,
+        positions_filename=args.positions,
+        cleaner=cleaner(args),
+    )
+    calculator.calculate()
+    calculator.save(filename=args.file)
+
+
 def calculate_delays(args):
     if not args.dry:
         calculator = warsawbus.DelayCalculator(
@@ -86,12 +312,27 @@ def calculate_delays(args):
             positions_filename=args.positions,
             start=dateutil.parser.parse(args.start),
             end=dateutil.parser.parse(args.end),
+            arrivals_filename=args.arrivals,
+            cache=partition_cache(args),
+            cleaner=cleaner(args),
         )
+        if args.fraction is not None:
+            approximate(calculator, args.fraction, 'Delay')
+            return
+        if args.radii:
+            calculator.sweep(
+                radii=[float(r) for r in args.radii.split(',')],
+                time_thresholds=[datetime.timedelta(minutes=float(t))
+                                 for t in args.time_thresholds.split(',')],
+                long=args.long,
+            )
+            calculator.save(filename=args.file)
+            return
         calculator.calculate()
         calculator.save(filename=args.file)
 
     plotter = warsawbus.WarsawPlotter(filename=args.file, column_name='Delay',
-                                      bounds=(0, 20))
+                                      bounds=(0, 20), cache=plot_cache(args))
     plotter.plot(filename='', title='Warsaw buses delays [min]',
                  size=10, opacity=0.9, colorscale='Burgyl')
 
@@ -100,11 +341,35 @@ if __name__ == '__main__':
     parser = initialize_parser()
     args = parser.parse_args()
 
+    if args.subcommand == 'store' and args.simplify and not args.schedules:
+        parser.error('--simplify requires --schedules providing stops')
+    approximated = args.subcommand in ['speeds', 'delays'] and \
+        args.fraction is not None
+    if approximated and not 0 < args.fraction <= 1:
+        parser.error('--fraction must be greater than 0 and at most 1')
+    if approximated and args.partition_cache:
+        parser.error('--fraction cannot be used with --partition_cache')
+    if approximated and args.subcommand == 'delays' and args.radii:
+        parser.error('--fraction cannot be used with --radii')
+    if args.subcommand == 'delays' and \
+            bool(args.radii) != bool(args.time_thresholds):
+        parser.error('--radii and --time_thresholds must be given together')
+    if args.subcommand == 'delays' and args.radii and args.arrivals:
+        parser.error('--radii requires --positions, not --arrivals')
+
     if args.subcommand == 'positions':
         fetch_positions(args)
+    elif args.subcommand == 'daemon':
+        fetch_daemon(args)
+    elif args.subcommand == 'live':
+        plot_live(args)
     elif args.subcommand == 'schedules':
         fetch_schedules(args)
+    elif args.subcommand == 'store':
+        store_positions(args)
     elif args.subcommand == 'speeds':
         calculate_speeds(args)
+    elif args.subcommand == 'arrivals':
+        calculate_arrivals(args)
     elif args.subcommand == 'delays':
         calculate_delays(args)
@@ -1,22 +1,42 @@
 from .statistics import (
+    ArrivalCalculator,
     Calculator,
     DelayCalculator,
+    PartitionCache,
+    PositionCleaner,
     SpeedCalculator,
+    StopIndex,
+    TrajectorySimplifier,
+    TrajectoryStore,
 )
 from .fetch import (
+    Collector,
     Fetcher,
+    FreshnessScheduler,
+    GtfsScheduleFetcher,
     PositionFetcher,
     ScheduleFetcher,
 )
-from warsawbus.visualize import WarsawPlotter
+from warsawbus.visualize import LivePlotter, PlotDataCache, WarsawPlotter
 
 
 __all__ = [
+    'ArrivalCalculator',
     'Fetcher',
+    'FreshnessScheduler',
+    'GtfsScheduleFetcher',
     'Calculator',
+    'Collector',
     'DelayCalculator',
+    'LivePlotter',
+    'PartitionCache',
+    'PlotDataCache',
+    'PositionCleaner',
     'PositionFetcher',
     'ScheduleFetcher',
     'SpeedCalculator',
+    'StopIndex',
+    'TrajectorySimplifier',
+    'TrajectoryStore',
     'WarsawPlotter',
 ]
@@ -1,10 +1,16 @@
+from .collector import Collector
 from .fetcher import Fetcher, FetcherException
+from .freshness_scheduler import FreshnessScheduler
+from .gtfs_schedule_fetcher import GtfsScheduleFetcher
 from .position_fetcher import PositionFetcher
 from .schedule_fetcher import ScheduleFetcher
 
 __all__ = [
+    'Collector',
     'Fetcher',
     'FetcherException',
+    'FreshnessScheduler',
+    'GtfsScheduleFetcher',
     'PositionFetcher',
     'ScheduleFetcher',
 ]
@@ -0,0 +1,178 @@
+import concurrent.futures
+import datetime
+import time
+
+
+class Clock:
+    """Time, which `Collector` schedules ticks and waits for fetches by.
+
+    Replaced in tests by a simulated one, so ticks do not depend on the load
+    of the machine.
+    """
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+    @staticmethod
+    def now():
+        return datetime.datetime.now()
+
+    @staticmethod
+    def sleep(seconds):
+        time.sleep(seconds)
+
+    @staticmethod
+    def executor(workers):
+        """Get executor running fetches concurrently."""
+
+        return concurrent.futures.ThreadPoolExecutor(workers)
+
+    @staticmethod
+    def wait(futures, timeout=None):
+        """Wait until all the futures are done or timeout passes."""
+
+        concurrent.futures.wait(futures, timeout=timeout)
+
+
+class Collector:
+    """Class for collecting data of several fetchers in a daemon mode.
+
+    Ticks are scheduled against a monotonic clock, so they do not drift.
+    All fetchers are queried concurrently and each fetch is given time until
+    the next tick. A fetch which misses its deadline keeps running in the
+    background, but its fetcher is skipped until it finishes, so a slow
+    response never delays the next tick. Data is saved in a new file every
+    hour.
+    """
+
+    PERIOD_FORMAT = '%Y%m%d_%H'
+
+    def __init__(self, fetchers, step, file_pattern, clock=None):
+        """Initialize Collector.
+
+        Parameters
+        ----------
+        fetchers : dict
+            Fetchers by name, i.e. {'bus': PositionFetcher(...)}.
+        step : timedelta
+        file_pattern : str
+            Data destination filename pattern, with `name` and `period`
+            fields, i.e. 'positions_{name}_{period}.csv'.
+        clock : Clock, optional
+            Time to collect data by, the real one by default.
+        """
+
+        self.fetchers = fetchers
+        self.step = step.total_seconds()
+        self.file_pattern = file_pattern
+        self.clock = clock or Clock()
+        # fetches still in progress by fetcher name
+        self.pending = {}
+        # periods, which data is to be saved by fetcher name
+        self.rotating = {}
+        self.period = None
+        # statistics of each tick
+        self.ticks = []
+
+    def run(self, end=None):
+        """Collect data until given date or until interrupted.
+
+        Parameters
+        ----------
+        end : date, optional
+        """
+
+        self.period = self._period()
+        workers = len(self.fetchers)
+        start = self.clock.monotonic()
+        tick = 0
+
+        with self.clock.executor(workers) as executor:
+            try:
+                while True:
+                    deadline = start + tick * self.step
+                    self.clock.sleep(max(deadline - self.clock.monotonic(), 0))
+                    if end is not None and self.clock.now() >= end:
+                        break
+                    self._tick(executor, tick, deadline)
+
+                    # skip ticks missed i.e. because of system suspension
+                    elapsed = self.clock.monotonic() - start
+                    tick = max(tick + 1, int(elapsed // self.step))
+            except KeyboardInterrupt:
+                print('Collecting interrupted')
+            finally:
+                self.clock.wait(self.pending.values())
+                self._rotate(force=True)
+
+    def _tick(self, executor, tick, deadline):
+        """Start fetches and wait for them till the next tick."""
+
+        lag = self.clock.monotonic() - deadline
+        self._rotate()
+
+        started = self.clock.monotonic()
+        finished = {}
+        futures = {}
+        for name, fetcher in self.fetchers.items():
+            # fetch finished since the previous tick is not skipped
+            if name in self.pending and not self.pending[name].done():
+                continue
+            future = executor.submit(self._fetch, fetcher, name, finished)
+            futures[name] = future
+            self.pending[name] = future
+
+        self.clock.wait(futures.values(),
+                        timeout=max(deadline + self.step - started, 0))
+
+        report = {}
+        for name in self.fetchers:
+            if name not in futures:
+                report[name] = 'skipped'
+            elif not futures[name].done():
+                report[name] = 'timeout'
+            elif futures[name].exception():
+                report[name] = f'error ({futures[name].exception()})'
+            else:
+                report[name] = f'{finished[name] - started:.3f}s'
+
+        for name, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[name]
+
+        self.ticks.append({'tick': tick, 'lag': lag, **report})
+        summary = ', '.join(f'{name} {value}' for name, value in report.items())
+        print(f'Tick {tick} at {self.clock.now()}: {summary} '
+              f'(lag {lag:.3f}s)')
+
+    def _fetch(self, fetcher, name, finished):
+        """Fetch data, recording the time it finished at."""
+
+        try:
+            fetcher.fetch()
+        finally:
+            finished[name] = self.clock.monotonic()
+
+    def _rotate(self, force=False):
+        """Save data of fetchers to files of the finished period.
+
+        Fetchers with a fetch in progress are saved once it finishes.
+        """
+
+        period = self._period()
+        if force or period != self.period:
+            for name in self.fetchers:
+                self.rotating.setdefault(name, self.period)
+            self.period = period
+
+        for name, rotated in list(self.rotating.items()):
+            if name in self.pending and not self.pending[name].done():
+                continue
+            filename = self.file_pattern.format(name=name, period=rotated)
+            print(f'Saving {filename}')
+            self.fetchers[name].flush(filename)
+            del self.rotating[name]
+
+    def _period(self):
+        return self.clock.now().strftime(self.PERIOD_FORMAT)
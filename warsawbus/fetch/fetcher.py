@@ -11,14 +11,24 @@ class FetcherException(Exception):
 class Fetcher:
     """Base class for fetching data."""
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, timeout=None):
+        """Initialize Fetcher.
+
+        Parameters
+        ----------
+        api_key : str
+        timeout : float, optional
+            Seconds to wait for a response, before giving up on a request.
+        """
+
         self.api_key = api_key
+        self.timeout = timeout
         self.data = []
 
     def fetch(self):
         raise NotImplementedError
 
-    def fetch_loop(self, start, end, step):
+    def fetch_loop(self, start, end, step, callback=None, scheduler=None):
         """Fetch data in a loop for a given period of time.
 
         Parameters
@@ -26,21 +36,44 @@ class Fetcher:
         start : date
         end : date
         step : timedelta
+        callback : callable, optional
+            Called with the fetcher after each successful fetch.
+        scheduler : FreshnessScheduler, optional
+            Scheduler of fetches according to freshness of the data, used
+            instead of the fixed step.
         """
 
         next_step = start
         while datetime.datetime.now() < end:
             # wait till next_step
             while datetime.datetime.now() < next_step:
-                time.sleep(5)
+                remaining = next_step - datetime.datetime.now()
+                time.sleep(min(max(remaining.total_seconds(), 0), 5))
 
             print(f'Fetching at {next_step}')
             try:
                 self.fetch()
-                next_step = next_step + step
+                if scheduler:
+                    next_step = scheduler.next_step(datetime.datetime.now(),
+                                                    self.newest())
+                else:
+                    next_step = next_step + step
+                if callback:
+                    callback(self)
             except FetcherException as err:
                 print(f'FetcherException ({err}) occurred, retrying request')
 
+    def newest(self):
+        """Get the newest time in the data of the latest fetch, if known."""
+
+        return None
+
     def save(self, filename):
         dataframe = pd.DataFrame(self.data)
         dataframe.to_csv(filename)
+
+    def flush(self, filename):
+        """Save data fetched so far and start gathering from scratch."""
+
+        self.save(filename)
+        self.data = []
@@ -0,0 +1,98 @@
+import collections
+import datetime
+
+
+class FreshnessScheduler:
+    """Class for scheduling fetches according to freshness of the data.
+
+    Feed is updated in its own cadence, so polling it more often only
+    returns duplicates. Scheduler watches the newest time reported by each
+    response. Once it advances, the cadence of updates and the delay of their
+    publication are estimated, and the next fetch is scheduled just after the
+    next update is expected. While the feed is stale, i.e. at night, fetches
+    are backed off exponentially. Data is never fetched less often than the
+    maximum staleness, so no update stays unnoticed for longer.
+    """
+
+    # weight of the latest interval in the estimated cadence
+    SMOOTHING = 0.5
+    # number of latest publication delays, the smallest of which is used
+    DELAYS = 10
+
+    def __init__(self, min_step=datetime.timedelta(seconds=2),
+                 max_staleness=datetime.timedelta(seconds=60),
+                 margin=datetime.timedelta(seconds=1), backoff=2):
+        """Initialize FreshnessScheduler.
+
+        Parameters
+        ----------
+        min_step : timedelta
+            Minimum time between fetches.
+        max_staleness : timedelta
+            Maximum time between fetches, even if the feed is stale.
+        margin : timedelta
+            Time waited after the expected publication of an update.
+        backoff : float
+            Factor, by which time between fetches grows while the feed is stale.
+        """
+
+        self.min_step = min_step
+        self.max_staleness = max_staleness
+        self.margin = margin
+        self.backoff = backoff
+
+        self.newest = None
+        # estimated time between updates of the feed
+        self.period = None
+        # latest delays between the newest time and its publication
+        self.delays = collections.deque(maxlen=self.DELAYS)
+        # number of fetches since the latest update
+        self.misses = 0
+
+    def next_step(self, now, newest):
+        """Get time of the next fetch.
+
+        Parameters
+        ----------
+        now : datetime
+            Time of the latest fetch.
+        newest : datetime or None
+            The newest time in the data of the latest fetch.
+
+        Returns
+        -------
+        datetime
+        """
+
+        if newest is None or (self.newest is not None and
+                              newest <= self.newest):
+            self.misses += 1
+            step = self.min_step * self.backoff ** (self.misses - 1)
+            return now + self._clip(step)
+
+        if self.newest is not None:
+            interval = newest - self.newest
+            # interval of an update fetched without stale fetches before it
+            # may span several updates, so it may only lower the estimate,
+            # while intervals longer than max staleness mean a stale feed
+            if interval <= self.max_staleness and (
+                    self.period is None or self.misses > 0 or
+                    interval < self.period):
+                self.period = interval if self.period is None else \
+                    self.SMOOTHING * interval + \
+                    (1 - self.SMOOTHING) * self.period
+        # delay is known precisely only after a stale fetch, otherwise it
+        # includes the time the fetch was late by
+        delay = now - newest
+        if self.misses > 0 or not self.delays or delay < min(self.delays):
+            self.delays.append(delay)
+        self.newest = newest
+        self.misses = 0
+
+        if self.period is None:
+            return now + self.min_step
+        expected = newest + self.period + min(self.delays) + self.margin
+        return now + self._clip(expected - now)
+
+    def _clip(self, step):
+        return min(max(step, self.min_step), self.max_staleness)
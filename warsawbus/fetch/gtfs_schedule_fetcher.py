@@ -0,0 +1,135 @@
+from .fetcher import Fetcher
+
+import csv
+import datetime
+import io
+import zipfile
+
+
+class GtfsScheduleFetcher(Fetcher):
+    """Class for reading bus schedule from a local GTFS feed.
+
+    Data has the same format as the one of `ScheduleFetcher`, so it is read
+    by `DelayCalculator` the same way. Schedule is read for trips of services
+    active on a given day, until midnight. As in the API schedule, times of
+    trips running past midnight are given past 24:00, and they are read from
+    the trips of the previous day, which run in the early hours of the day.
+    """
+
+    WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                'saturday', 'sunday']
+    # trips columns, which may hold brigade number, in order of preference
+    BRIGADE_COLUMNS = ['brigade', 'block_id']
+
+    def __init__(self, filename, date):
+        """Initialize GtfsScheduleFetcher.
+
+        Parameters
+        ----------
+        filename : str
+            Path to a GTFS .zip archive.
+        date : date
+            Day of the schedule.
+        """
+
+        super().__init__(api_key=None)
+        self.filename = filename
+        self.date = date
+
+    def fetch(self):
+        """Read schedule of the day."""
+
+        with zipfile.ZipFile(self.filename) as feed:
+            services = self.read_services(feed, self.date)
+            previous = self.read_services(
+                feed, self.date - datetime.timedelta(days=1)
+            )
+            routes = {
+                route['route_id']: route['route_short_name']
+                for route in self.read(feed, 'routes.txt')
+            }
+            # trips with whether they run on the day and on the previous one
+            trips = {
+                trip['trip_id']: (routes[trip['route_id']], self.brigade(trip),
+                                  trip['service_id'] in services,
+                                  trip['service_id'] in previous)
+                for trip in self.read(feed, 'trips.txt')
+                if trip['service_id'] in services or
+                trip['service_id'] in previous
+            }
+            stops = {
+                stop['stop_id']: (stop['stop_name'], float(stop['stop_lon']),
+                                  float(stop['stop_lat']))
+                for stop in self.read(feed, 'stops.txt')
+            }
+            self.process_stop_times(self.read(feed, 'stop_times.txt'), trips,
+                                    stops)
+
+    def process_stop_times(self, stop_times, trips, stops):
+        """Parse stop times of the trips of the day.
+
+        Stop times past 24:00 are kept only of the trips of the previous day,
+        the others only of the trips of the day.
+        """
+
+        for stop_time in stop_times:
+            trip = trips.get(stop_time['trip_id'])
+            if trip is None:
+                continue
+
+            line, brigade, today, yesterday = trip
+            time = stop_time['arrival_time'] or stop_time['departure_time']
+            past_midnight = int(time.split(':')[0]) >= 24
+            if not (yesterday if past_midnight else today):
+                continue
+
+            name, lon, lat = stops[stop_time['stop_id']]
+            self.data.append({
+                'Lines': line,
+                'Lon': lon,
+                'Lat': lat,
+                'Brigade': brigade,
+                'BusStopName': name,
+                # hours may be given with a single digit
+                'Time': time.strip().zfill(8),
+            })
+
+    def read_services(self, feed, date):
+        """Get identifiers of services active on a day."""
+
+        services = set()
+        day = date.strftime('%Y%m%d')
+        names = feed.namelist()
+
+        if 'calendar.txt' in names:
+            weekday = self.WEEKDAYS[date.weekday()]
+            for service in self.read(feed, 'calendar.txt'):
+                if service[weekday] == '1' and \
+                        service['start_date'] <= day <= service['end_date']:
+                    services.add(service['service_id'])
+
+        if 'calendar_dates.txt' in names:
+            for exception in self.read(feed, 'calendar_dates.txt'):
+                if exception['date'] != day:
+                    continue
+                # 1 means service added for the day, 2 means removed
+                if exception['exception_type'] == '1':
+                    services.add(exception['service_id'])
+                else:
+                    services.discard(exception['service_id'])
+
+        return services
+
+    def brigade(self, trip):
+        for column in self.BRIGADE_COLUMNS:
+            if trip.get(column):
+                return trip[column]
+        return None
+
+    @staticmethod
+    def read(feed, name):
+        """Stream rows of a file from the feed."""
+
+        with feed.open(name) as file:
+            yield from csv.DictReader(io.TextIOWrapper(file,
+                                                       encoding='utf-8-sig'))
@@ -1,24 +1,56 @@
 from .fetcher import Fetcher, FetcherException
 
 import json
+import pandas as pd
 import requests
 
 
 class PositionFetcher(Fetcher):
     """Class for fetching buses position data."""
 
-    def __init__(self, api_key):
-        super().__init__(api_key)
+    BUS = 1
+    TRAM = 2
+
+    # quantile of times of the latest response considered the newest one,
+    # so a few vehicles with wrong clocks do not matter
+    NEWEST_QUANTILE = 0.95
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, api_key, vehicle_type=BUS, timeout=None,
+                 simplifier=None, stop_index=None):
+        """Initialize PositionFetcher.
+
+        Parameters
+        ----------
+        api_key : str
+        vehicle_type : int
+            `BUS` or `TRAM`.
+        timeout : float, optional
+            Seconds to wait for a response, before giving up on a request.
+        simplifier : TrajectorySimplifier, optional
+            Simplifier of tracks, applied to positions before saving them.
+        stop_index : StopIndex, optional
+            Index of stops, which positions are tagged with as they arrive.
+        """
+
+        super().__init__(api_key, timeout)
+        self.vehicle_type = vehicle_type
+        self.simplifier = simplifier
+        self.stop_index = stop_index
         self.idents = set()
+        # positions and their identifiers from the latest response
+        self.latest = []
+        self.last_idents = set()
 
     def fetch(self):
         """Get current buses positions."""
 
         resource_id = 'f2e5503e927d-4ad3-9500-4ab9e55deb59'
         url = f'https://api.um.warszawa.pl/api/action/busestrams_get/' \
-              f'?resource_id={resource_id}&apikey={self.api_key}&type=1'
+              f'?resource_id={resource_id}&apikey={self.api_key}' \
+              f'&type={self.vehicle_type}'
 
-        response = requests.get(url)
+        response = requests.get(url, timeout=self.timeout)
         self.process_positions(json.loads(response.text)['result'])
 
     def process_positions(self, positions):
@@ -27,9 +59,51 @@ class PositionFetcher(Fetcher):
         if not isinstance(positions, list):
             raise FetcherException('Response is not a position list')
 
+        self.latest = positions
+        # feed clock at the time of fetching, so stale and future positions
+        # are found regardless of the order of saved positions
+        newest = self.newest()
+        fetch_time = None if newest is None else \
+            newest.strftime(self.TIME_FORMAT)
+
+        self.last_idents = set()
+        new = []
         for position in positions:
             # delete redundant positions of specific vehicle at specific time
             ident = (position['VehicleNumber'], position['Time'])
+            self.last_idents.add(ident)
             if ident not in self.idents:
-                self.data.append(position)
+                new.append(dict(position, FetchTime=fetch_time))
                 self.idents.add(ident)
+
+        if self.stop_index is not None and new:
+            self.stop_index.tag(new)
+        self.data.extend(new)
+
+    def newest(self):
+        """Get the newest time of positions in the latest response."""
+
+        if not self.latest:
+            return None
+        times = pd.to_datetime(pd.Series([position['Time']
+                                          for position in self.latest]),
+                               errors='coerce')
+        newest = times.quantile(self.NEWEST_QUANTILE)
+        return None if pd.isna(newest) else newest.floor('s').to_pydatetime()
+
+    def save(self, filename):
+        if self.simplifier is None or not self.data:
+            return super().save(filename)
+
+        dataframe = self.simplifier.simplify(pd.DataFrame(self.data))
+        dataframe.reset_index(drop=True).to_csv(filename)
+
+    def flush(self, filename):
+        """Save positions fetched so far and start gathering from scratch.
+
+        Positions from the latest response are still considered duplicates,
+        so they are not repeated in the next file.
+        """
+
+        super().flush(filename)
+        self.idents = set(self.last_idents)
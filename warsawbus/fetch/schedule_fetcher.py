@@ -9,36 +9,49 @@ import requests
 class ScheduleFetcher(Fetcher):
     """Class for fetching bus schedule."""
 
+    STOPS_RESOURCE_ID = 'ab75c33d-3a26-4342-b36a-6e5fef0a3ac3'
+
     def fetch(self):
         """Get current schedule."""
 
-        resource_id = 'ab75c33d-3a26-4342-b36a-6e5fef0a3ac3'
+        self.process_stops(self.request_stops())
+
+    def fetch_stops(self):
+        """Get current stops only, i.e. to build `StopIndex` of them."""
+
+        return self.current_stops(self.request_stops())
+
+    def request_stops(self):
         url = f'https://api.um.warszawa.pl/api/action/dbstore_get/' \
-              f'?id={resource_id}&apikey={self.api_key}'
+              f'?id={self.STOPS_RESOURCE_ID}&apikey={self.api_key}'
 
-        response = requests.get(url)
-        self.process_stops(json.loads(response.text)['result'])
+        response = requests.get(url, timeout=self.timeout)
+        return json.loads(response.text)['result']
 
     def process_stops(self, stops):
         """Parse stops data."""
 
+        stops = self.current_stops(stops)
+        for i, stop in enumerate(stops):
+            print(f'Processing stop {i}/{len(stops)}: {stop["nazwa_zespolu"]} '
+                  f'{stop["slupek"]} - {datetime.datetime.now()}')
+            self.fetch_lines(stop)
+
+    @classmethod
+    def current_stops(cls, stops):
+        """Get normalized stops without their old locations."""
+
+        stops = [cls.normalize(stop) for stop in stops]
         current = collections.defaultdict(str)
 
         for stop in stops:
-            stop = self.normalize(stop)
             ident = (stop['zespol'], stop['slupek'])
             # get rid of old stops locations
             current[ident] = max(current[ident], stop['obowiazuje_od'])
 
-        for i, stop in enumerate(stops):
-            stop = self.normalize(stop)
-            ident = (stop['zespol'], stop['slupek'])
-            if current[ident] != stop['obowiazuje_od']:
-                continue
-
-            print(f'Processing stop {i}/{len(stops)}: {stop["nazwa_zespolu"]} '
-                  f'{stop["slupek"]} - {datetime.datetime.now()}')
-            self.fetch_lines(stop)
+        return [stop for stop in stops
+                if current[(stop['zespol'], stop['slupek'])] ==
+                stop['obowiazuje_od']]
 
     def fetch_lines(self, stop):
         """Fetch lines operating at given stop."""
@@ -48,7 +61,7 @@ class ScheduleFetcher(Fetcher):
               f'?id={resource_id}&apikey={self.api_key}' \
               f'&busstopId={stop["zespol"]}&busstopNr={stop["slupek"]}'
 
-        response = requests.get(url)
+        response = requests.get(url, timeout=self.timeout)
         self.process_lines(json.loads(response.text)['result'], stop)
 
     def process_lines(self, lines, stop):
@@ -67,7 +80,7 @@ class ScheduleFetcher(Fetcher):
               f'&busstopId={stop["zespol"]}&busstopNr={stop["slupek"]}' \
               f'&line={line["linia"]}'
 
-        response = requests.get(url)
+        response = requests.get(url, timeout=self.timeout)
         self.process_schedules(json.loads(response.text)['result'], line, stop)
 
     def process_schedules(self, schedules, line, stop):
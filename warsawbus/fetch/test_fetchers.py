@@ -1,13 +1,21 @@
+import concurrent.futures
+import datetime
+import zipfile
+
 import pandas as pd
 import pytest
 import unittest.mock
 
+from .collector import Clock, Collector
 from .fetcher import (
     Fetcher,
     FetcherException,
 )
+from .freshness_scheduler import FreshnessScheduler
+from .gtfs_schedule_fetcher import GtfsScheduleFetcher
 from .position_fetcher import PositionFetcher
 from .schedule_fetcher import ScheduleFetcher
+from ..statistics.stop_index import StopIndex
 
 
 class TestBaseFetcher:
@@ -61,7 +69,9 @@ class TestPositionFetcher:
 
         fetcher = PositionFetcher(api_key='foo')
         fetcher.process_positions(positions)
-        assert fetcher.data == positions
+        # 95th percentile of times of the response
+        assert fetcher.data == [dict(position, FetchTime='2021-02-02 17:09:00')
+                                for position in positions]
 
     def test_process_positions_repeating(self):
         positions = [{
@@ -74,7 +84,199 @@ class TestPositionFetcher:
 
         fetcher = PositionFetcher(api_key='foo')
         fetcher.process_positions(positions)
-        assert fetcher.data == [positions[0]]
+        assert fetcher.data == [dict(positions[0],
+                                     FetchTime='2021-02-02 17:00:27')]
+
+    def test_newest(self):
+        positions = [{
+            'Lines': '523',
+            'Lon': 20,
+            'Lat': 50,
+            'VehicleNumber': i,
+            'Time': f'2021-02-02 17:00:{i:02d}',
+        } for i in range(40)]
+        # vehicle with a wrong clock
+        positions[0]['Time'] = '2021-02-02 23:00:00'
+
+        fetcher = PositionFetcher(api_key='foo')
+        assert fetcher.newest() is None
+        fetcher.process_positions(positions)
+        newest = fetcher.newest()
+        assert datetime.datetime(2021, 2, 2, 17, 0, 30) < newest < \
+            datetime.datetime(2021, 2, 2, 17, 1)
+
+    def test_flush(self, tmpdir):
+        positions = [{
+            'Lines': '523',
+            'Lon': 20,
+            'Lat': 50,
+            'VehicleNumber': 0,
+            'Time': '2021-02-02 17:00:27',
+        }]
+
+        fetcher = PositionFetcher(api_key='foo')
+        fetcher.process_positions(positions)
+        fetcher.flush(tmpdir / 'file.csv')
+        assert fetcher.data == []
+
+        # same response after flushing is still a duplicate
+        fetcher.process_positions(positions)
+        assert fetcher.data == []
+
+    def test_process_positions_stops(self):
+        stops = [dict(TestScheduleFetcher.STOPS[0], szer_geo=52.2,
+                      dlug_geo=21.0)]
+        positions = [{
+            'Lines': '523',
+            'Lon': 21.0,
+            'Lat': 52.2 + i / 10000,
+            'VehicleNumber': i,
+            'Time': '2021-02-02 17:00:27',
+        } for i in range(10)]
+
+        fetcher = PositionFetcher(api_key='foo',
+                                  stop_index=StopIndex.from_stops(stops))
+        fetcher.process_positions(positions)
+
+        assert [position['StopId'] for position in fetcher.data] == \
+            ['420_0'] * 5 + [None] * 5
+        assert fetcher.data[0]['StopDistance'] == 0
+        assert fetcher.data[1]['StopDistance'] == pytest.approx(0.0111,
+                                                                abs=1e-4)
+
+
+class TestCollector:
+    class FakeClock(Clock):
+        """Simulated time, which passes only while sleeping and waiting.
+
+        Fetches run, once the clock gets to the time they finish at, the
+        `delay` of their fetcher after they started.
+        """
+
+        def __init__(self):
+            self.time = 0
+            # fetches in progress with the time they finish at
+            self.running = []
+
+        def monotonic(self):
+            return self.time
+
+        def now(self):
+            return datetime.datetime(2021, 2, 2, 16) + \
+                datetime.timedelta(seconds=self.time)
+
+        def sleep(self, seconds):
+            self._advance(self.time + seconds)
+
+        def executor(self, workers):
+            return self
+
+        def wait(self, futures, timeout=None):
+            futures = list(futures)
+            finish = max([finish for finish, future, _ in self.running
+                          if future in futures], default=self.time)
+            self._advance(finish if timeout is None else
+                          min(finish, self.time + timeout))
+
+        def submit(self, fn, fetcher, *args):
+            future = concurrent.futures.Future()
+            self.running.append((self.time + getattr(fetcher, 'delay', 0),
+                                 future, lambda: fn(fetcher, *args)))
+            return future
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def _advance(self, until):
+            for fetch in sorted(self.running, key=lambda fetch: fetch[0]):
+                finish, future, fn = fetch
+                if finish > until:
+                    break
+                self.time = finish
+                self.running.remove(fetch)
+                try:
+                    future.set_result(fn())
+                except Exception as err:
+                    future.set_exception(err)
+            self.time = max(self.time, until)
+
+    class DelayedFetcher(Fetcher):
+        def __init__(self, delay):
+            super().__init__(api_key='foo')
+            self.delay = delay
+
+        def fetch(self):
+            self.data.append({'a': len(self.data)})
+
+    def test_run(self, tmpdir):
+        fetchers = {
+            'fast': self.DelayedFetcher(delay=0),
+            'slow': self.DelayedFetcher(delay=2.5),
+        }
+        clock = self.FakeClock()
+        collector = Collector(fetchers=fetchers,
+                              step=datetime.timedelta(seconds=1),
+                              file_pattern=str(tmpdir / '{name}_{period}.csv'),
+                              clock=clock)
+        collector.run(end=clock.now() + datetime.timedelta(seconds=9.5))
+
+        # slow fetch never delays the ticks
+        assert [tick['tick'] for tick in collector.ticks] == list(range(10))
+        assert all(tick['lag'] == 0 for tick in collector.ticks)
+        assert all(tick['fast'] == '0.000s' for tick in collector.ticks)
+        assert [tick['slow'] for tick in collector.ticks] == \
+            ['timeout', 'skipped', 'skipped'] * 3 + ['timeout']
+
+        saved = pd.read_csv(tmpdir / f'fast_{collector.period}.csv')
+        assert len(saved) == 10
+        # the last slow fetch is waited for
+        saved = pd.read_csv(tmpdir / f'slow_{collector.period}.csv')
+        assert len(saved) == 4
+
+    def test_tick(self, tmpdir):
+        class FailingFetcher(Fetcher):
+            def fetch(self):
+                raise FetcherException('foo')
+
+        fetchers = {
+            'fast': self.DelayedFetcher(delay=0.05),
+            'deadline': self.DelayedFetcher(delay=0.5),
+            'failing': FailingFetcher(api_key='foo'),
+        }
+        clock = self.FakeClock()
+        collector = Collector(fetchers=fetchers,
+                              step=datetime.timedelta(seconds=0.5),
+                              file_pattern=str(tmpdir / '{name}_{period}.csv'),
+                              clock=clock)
+        collector.period = collector._period()
+
+        with clock.executor(3) as executor:
+            collector._tick(executor, 0, clock.monotonic())
+
+        # finish time is recorded by the fetch itself, so the fetch finished
+        # in time is never reported as timed out
+        tick = collector.ticks[0]
+        assert tick['fast'] == '0.050s'
+        assert tick['deadline'] == '0.500s'
+        assert tick['failing'] == 'error (foo)'
+        assert collector.pending == {}
+
+    @unittest.mock.patch.object(Collector, '_period')
+    def test_rotation(self, mock, tmpdir):
+        mock.side_effect = ['a', 'a', 'b', 'b', 'b']
+        fetchers = {'fast': self.DelayedFetcher(delay=0)}
+        clock = self.FakeClock()
+        collector = Collector(fetchers=fetchers,
+                              step=datetime.timedelta(seconds=1),
+                              file_pattern=str(tmpdir / '{name}_{period}.csv'),
+                              clock=clock)
+        collector.run(end=clock.now() + datetime.timedelta(seconds=2.5))
+
+        assert len(pd.read_csv(tmpdir / 'fast_a.csv')) == 1
+        assert len(pd.read_csv(tmpdir / 'fast_b.csv')) == 2
 
 
 class TestScheduleFetcher:
@@ -121,6 +323,14 @@ class TestScheduleFetcher:
         mock.assert_has_calls(expected_calls)
         assert mock.call_count == len(expected_calls)
 
+    def test_current_stops(self):
+        moved = dict(self.STOPS[0], dlug_geo=21,
+                     obowiazuje_od='2021-01-01 00:00:00')
+        stops = [self.denormalize(data) for data in self.STOPS + [moved]]
+
+        current = ScheduleFetcher.current_stops(stops)
+        assert current == self.STOPS[1:] + [moved]
+
     @unittest.mock.patch.object(ScheduleFetcher, 'process_lines')
     def test_fetch_lines(self, mock, requests_mock):
         url = f'https://api.um.warszawa.pl/api/action/dbtimetable_get/' \
@@ -181,3 +391,145 @@ class TestScheduleFetcher:
     @staticmethod
     def denormalize(data):
         return {'values': [{'key': k, 'value': v} for k, v in data.items()]}
+
+
+class TestGtfsScheduleFetcher:
+    FEED = {
+        'calendar.txt': [
+            'service_id,monday,tuesday,wednesday,thursday,friday,saturday,'
+            'sunday,start_date,end_date',
+            'workday,1,1,1,1,1,0,0,20210101,20211231',
+            'weekend,0,0,0,0,0,1,1,20210101,20211231',
+        ],
+        'calendar_dates.txt': [
+            'service_id,date,exception_type',
+            'weekend,20210405,1',
+            'workday,20210405,2',
+        ],
+        'routes.txt': [
+            'route_id,route_short_name,route_type',
+            'r1,523,3',
+        ],
+        'trips.txt': [
+            'route_id,service_id,trip_id,brigade',
+            'r1,workday,t1,4',
+            'r1,weekend,t2,6',
+        ],
+        'stops.txt': [
+            'stop_id,stop_name,stop_lat,stop_lon',
+            's1,Banacha,52.21,20.98',
+            's2,Pole Mokotowskie,52.22,21.0',
+        ],
+        'stop_times.txt': [
+            'trip_id,arrival_time,departure_time,stop_id,stop_sequence',
+            't1,4:49:00,4:49:00,s1,1',
+            't1,24:51:00,24:51:00,s2,2',
+            't2,05:19:00,05:19:00,s1,1',
+        ],
+    }
+
+    def write_feed(self, tmpdir):
+        with zipfile.ZipFile(tmpdir / 'feed.zip', 'w') as feed:
+            for name, lines in self.FEED.items():
+                feed.writestr(name, '\n'.join(lines) + '\n')
+
+    def test_fetch(self, tmpdir):
+        self.write_feed(tmpdir)
+
+        fetcher = GtfsScheduleFetcher(filename=tmpdir / 'feed.zip',
+                                      date=datetime.date(2021, 2, 2))
+        fetcher.fetch()
+
+        assert fetcher.data == [{
+            'Lines': '523',
+            'Lon': 20.98,
+            'Lat': 52.21,
+            'Brigade': '4',
+            'BusStopName': 'Banacha',
+            'Time': '04:49:00',
+        }, {
+            'Lines': '523',
+            'Lon': 21.0,
+            'Lat': 52.22,
+            'Brigade': '4',
+            'BusStopName': 'Pole Mokotowskie',
+            'Time': '24:51:00',
+        }]
+
+    def test_fetch_exception(self, tmpdir):
+        self.write_feed(tmpdir)
+
+        # Easter Monday follows weekend schedule
+        fetcher = GtfsScheduleFetcher(filename=tmpdir / 'feed.zip',
+                                      date=datetime.date(2021, 4, 5))
+        fetcher.fetch()
+
+        assert [row['Brigade'] for row in fetcher.data] == ['6']
+
+    def test_fetch_past_midnight(self, tmpdir):
+        self.write_feed(tmpdir)
+
+        # workday trips of Friday run past midnight into Saturday
+        fetcher = GtfsScheduleFetcher(filename=tmpdir / 'feed.zip',
+                                      date=datetime.date(2021, 2, 6))
+        fetcher.fetch()
+        assert [(row['Brigade'], row['Time']) for row in fetcher.data] == \
+            [('4', '24:51:00'), ('6', '05:19:00')]
+
+        # and not from Sunday into Monday
+        fetcher = GtfsScheduleFetcher(filename=tmpdir / 'feed.zip',
+                                      date=datetime.date(2021, 2, 1))
+        fetcher.fetch()
+        assert [(row['Brigade'], row['Time']) for row in fetcher.data] == \
+            [('4', '04:49:00')]
+
+
+class TestFreshnessScheduler:
+    @staticmethod
+    def feed(now, start, period, delay):
+        """Get the newest time published by a feed updated every period."""
+
+        updates = (now - start - delay) // period
+        return start + updates * period if updates >= 0 else None
+
+    def test_cadence(self):
+        start = datetime.datetime(2021, 2, 2, 17)
+        period = datetime.timedelta(seconds=10)
+        delay = datetime.timedelta(seconds=3)
+        scheduler = FreshnessScheduler()
+
+        now = start
+        fetches = []
+        while now < start + datetime.timedelta(minutes=10):
+            newest = self.feed(now, start, period, delay)
+            fetches.append((now, newest))
+            now = scheduler.next_step(now, newest)
+
+        assert scheduler.period == period
+        # after warming up, each fetch gets a new update soon after it is
+        # published, so fetches follow the cadence of the feed
+        late = fetches[10:]
+        newest = [newest for _, newest in late]
+        assert len(set(newest)) == len(newest)
+        assert all(now - newest - delay <= datetime.timedelta(seconds=2)
+                   for now, newest in late)
+        assert len(fetches) < 70
+
+    def test_backoff(self):
+        now = datetime.datetime(2021, 2, 2, 17)
+        newest = now - datetime.timedelta(minutes=5)
+        scheduler = FreshnessScheduler(
+            max_staleness=datetime.timedelta(seconds=30)
+        )
+
+        steps = []
+        for _ in range(8):
+            next_step = scheduler.next_step(now, newest)
+            steps.append((next_step - now).total_seconds())
+            now = next_step
+        assert steps == [2, 2, 4, 8, 16, 30, 30, 30]
+
+        # fetches speed up as soon as the feed is updated again
+        next_step = scheduler.next_step(now, now)
+        assert next_step - now == scheduler.min_step
+
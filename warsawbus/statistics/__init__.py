@@ -1,10 +1,22 @@
+from .arrival_calculator import ArrivalCalculator
 from .calculator import Calculator
 from .delay_calculator import DelayCalculator
+from .partition_cache import PartitionCache
+from .position_cleaner import PositionCleaner
 from .speed_calculator import SpeedCalculator
+from .stop_index import StopIndex
+from .trajectory_simplifier import TrajectorySimplifier
+from .trajectory_store import TrajectoryStore
 
 
 __all__ = [
+    'ArrivalCalculator',
     'Calculator',
     'DelayCalculator',
+    'PartitionCache',
+    'PositionCleaner',
     'SpeedCalculator',
+    'StopIndex',
+    'TrajectorySimplifier',
+    'TrajectoryStore',
 ]
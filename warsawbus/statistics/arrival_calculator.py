@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from .calculator import Calculator
+from .trajectory_store import TrajectoryStore
+
+
+class ArrivalCalculator(Calculator):
+    """Class for detecting bus arrivals at stops.
+
+    Each arrival event is a single visit of a vehicle in the radius of a stop
+    served by its line. Events are computed once and can be saved, so delays,
+    headways and travel times are derived from them without repeating the
+    geometric matching of positions against stops.
+    """
+
+    # consider only buses in less than 250 m from bus stop location
+    DISTANCE_THRESHOLD = 0.25
+
+    STOP_COLUMNS = ['Lines', 'BusStopName', 'Lat', 'Lon']
+    COLUMNS = ['Lines', 'Brigade', 'VehicleNumber', 'BusStopName', 'Lat', 'Lon',
+               'FirstTime', 'ClosestTime', 'LastTime', 'Distance']
+
+    def __init__(self, schedules_filename, positions_filename,
+                 radius=DISTANCE_THRESHOLD, cleaner=None):
+        """Initialize ArrivalCalculator.
+
+        Parameters
+        ----------
+        schedules_filename : str
+            Schedules providing stops served by each line.
+        positions_filename : str
+        radius : float
+            Distance in km from a stop, in which a bus is considered at it.
+        cleaner : PositionCleaner, optional
+            Cleaner removing invalid positions, before they are matched.
+        """
+
+        super().__init__()
+        self.cleaner = cleaner
+        schedules = pd.read_csv(schedules_filename, index_col=0,
+                                dtype=self.SCHEDULE_DTYPES)
+        self.stops = self.get_stops(schedules)
+        self.pos = self.read_positions(positions_filename, cleaner=cleaner)
+        self.pos['Time'] = pd.to_datetime(self.pos['Time'])
+        self.ordered = TrajectoryStore.is_store(positions_filename)
+        self.radius = radius
+
+    def calculate(self):
+        """Calculate arrival events."""
+
+        self.data = self.find_arrivals(self.pos, self.stops, self.radius,
+                                       self.ordered)
+
+    @classmethod
+    def get_stops(cls, schedules):
+        """Get unique stops served by each line."""
+
+        return schedules[cls.STOP_COLUMNS].drop_duplicates() \
+            .reset_index(drop=True)
+
+    @classmethod
+    def find_arrivals(cls, positions, stops, radius=DISTANCE_THRESHOLD,
+                      ordered=False):
+        """Match positions against stops of their lines.
+
+        Parameters
+        ----------
+        positions : DataFrame
+            Positions with parsed `Time`.
+        stops : DataFrame
+            Stops with `Lines`, `BusStopName`, `Lat` and `Lon` columns.
+        radius : float
+            Distance in km from a stop, in which a bus is considered at it.
+        ordered : bool
+            Whether positions are already sorted by vehicle and time, as read
+            from a trajectory store.
+
+        Returns
+        -------
+        DataFrame
+            One row per visit with the first, closest and last time in radius.
+        """
+
+        events = []
+        for stop, pos_line, same, distance in cls._distances(positions, stops,
+                                                             ordered):
+            inside = distance < radius
+            if not inside.any():
+                continue
+
+            # visit starts at each entry into the radius
+            previous = np.zeros(len(inside), dtype=bool)
+            previous[1:] = inside[:-1]
+            start = inside & ~(previous & same)
+            visits = pos_line[inside].assign(
+                Visit=np.cumsum(start)[inside],
+                Distance=distance[inside],
+            )
+            events.append(cls._summarize(visits, stop))
+
+        if not events:
+            return cls._empty()
+        return pd.concat(events, ignore_index=True)
+
+    @classmethod
+    def find_candidates(cls, positions, stops, radius=DISTANCE_THRESHOLD,
+                        ordered=False):
+        """Get all positions in radius of stops of their lines.
+
+        Parameters are the same as of `find_arrivals`.
+
+        Returns
+        -------
+        DataFrame
+            Position `Time` and `Distance` from each stop, with the stop
+            identified by its line, name and location.
+        """
+
+        candidates = []
+        for stop, pos_line, _, distance in cls._distances(positions, stops,
+                                                          ordered):
+            inside = distance < radius
+            candidates.append(pd.DataFrame({
+                'Lines': stop['Lines'],
+                'Brigade': pos_line['Brigade'].values[inside],
+                'BusStopName': stop['BusStopName'],
+                'Lat': stop['Lat'],
+                'Lon': stop['Lon'],
+                'Time': pos_line['Time'].values[inside],
+                'Distance': distance[inside],
+            }))
+
+        if not candidates:
+            return pd.DataFrame(columns=['Lines', 'Brigade', 'BusStopName',
+                                         'Lat', 'Lon', 'Time', 'Distance'])
+        return pd.concat(candidates, ignore_index=True)
+
+    @classmethod
+    def _distances(cls, positions, stops, ordered=False):
+        """Get distances of positions from each stop of their line.
+
+        Positions are sorted by vehicle and time, unless they are ordered.
+
+        Yields
+        ------
+        tuple
+            Stop, positions of its line ordered by vehicle and time, mask of
+            positions continuing a track of the same vehicle and brigade and
+            distances from the stop.
+        """
+
+        if not ordered:
+            positions = positions.sort_values(['VehicleNumber', 'Time'])
+        positions = positions.reset_index(drop=True)
+        stops_by_line = dict(list(stops.groupby('Lines')))
+
+        for line, pos_line in positions.groupby('Lines', sort=False):
+            if line not in stops_by_line:
+                continue
+            print(f'Line {line}')
+
+            lat, lon = pos_line['Lat'].values, pos_line['Lon'].values
+            same = np.zeros(len(pos_line), dtype=bool)
+            same[1:] = (pos_line['VehicleNumber'].values[1:] ==
+                        pos_line['VehicleNumber'].values[:-1]) & \
+                       (pos_line['Brigade'].values[1:] ==
+                        pos_line['Brigade'].values[:-1])
+
+            for _, stop in stops_by_line[line].iterrows():
+                distance = cls.get_distances(lat, lon, stop['Lat'], stop['Lon'])
+                yield stop, pos_line, same, distance
+
+    @classmethod
+    def _summarize(cls, visits, stop):
+        """Reduce in-radius positions to a single row per visit."""
+
+        grouped = visits.groupby('Visit', sort=False)
+        closest = visits.loc[grouped['Distance'].idxmin()]
+
+        return pd.DataFrame({
+            'Lines': stop['Lines'],
+            'Brigade': closest['Brigade'].values,
+            'VehicleNumber': closest['VehicleNumber'].values,
+            'BusStopName': stop['BusStopName'],
+            'Lat': stop['Lat'],
+            'Lon': stop['Lon'],
+            'FirstTime': grouped['Time'].min().values,
+            'ClosestTime': closest['Time'].values,
+            'LastTime': grouped['Time'].max().values,
+            'Distance': closest['Distance'].values,
+        }, columns=cls.COLUMNS)
+
+    @classmethod
+    def _empty(cls):
+        """Get arrival events table without any rows."""
+
+        data = pd.DataFrame(columns=cls.COLUMNS).astype(cls.ARRIVAL_DTYPES)
+        for column in cls.ARRIVAL_TIMES:
+            data[column] = pd.to_datetime(data[column])
+        return data
+
+    @classmethod
+    def load(cls, filename):
+        """Load previously saved arrival events."""
+
+        return pd.read_csv(filename, index_col=0, dtype=cls.ARRIVAL_DTYPES,
+                           parse_dates=cls.ARRIVAL_TIMES)
+
+    @classmethod
+    def headways(cls, arrivals):
+        """Get minutes between consecutive arrivals of a line at each stop."""
+
+        data = arrivals.sort_values(cls.STOP_COLUMNS + ['FirstTime'])
+        data['Headway'] = data.groupby(cls.STOP_COLUMNS)['FirstTime'] \
+            .diff().dt.total_seconds() / 60
+        return data
+
+    @staticmethod
+    def travel_times(arrivals):
+        """Get minutes of travel between consecutive stops of each vehicle."""
+
+        data = arrivals.sort_values(['VehicleNumber', 'ClosestTime'])
+        grouped = data.groupby(['VehicleNumber', 'Lines', 'Brigade'])
+        data['NextBusStopName'] = grouped['BusStopName'].shift(-1)
+        data['TravelTime'] = (grouped['ClosestTime'].shift(-1) -
+                              data['ClosestTime']).dt.total_seconds() / 60
+        return data.dropna(subset=['TravelTime'])
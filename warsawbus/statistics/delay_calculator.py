@@ -4,29 +4,79 @@ import dateutil.parser
 import numpy as np
 import pandas as pd
 
+from .arrival_calculator import ArrivalCalculator
 from .calculator import Calculator
+from .trajectory_store import TrajectoryStore
 
 
 class DelayCalculator(Calculator):
     """Class for calculating bus delays."""
 
-    def __init__(self, schedules_filename, positions_filename, start, end):
+    # consider only positions from 5 minutes before planned arrival
+    # to any time past arrival
+    TIME_THRESHOLD = datetime.timedelta(minutes=5)
+
+    UNIT_COLUMNS = ['Lines', 'Brigade']
+
+    def __init__(self, schedules_filename, positions_filename, start, end,
+                 arrivals_filename=None, cache=None, cleaner=None):
+        """Initialize DelayCalculator.
+
+        Parameters
+        ----------
+        schedules_filename : str
+        positions_filename : str
+            Positions, from which arrival events are found. Not read, when
+            `arrivals_filename` is given.
+        start : datetime
+        end : datetime
+        arrivals_filename : str, optional
+            Previously saved arrival events, see `ArrivalCalculator`.
+        cache : PartitionCache, optional
+            Cache of hourly partitions of results. With cache, input files
+            are read only if some partitions are missing.
+        cleaner : PositionCleaner, optional
+            Cleaner removing invalid positions, before arrivals are found.
+        """
+
         super().__init__()
-        self.data = pd.read_csv(schedules_filename, index_col=0,
+        self.schedules_filename = schedules_filename
+        self.positions_filename = positions_filename
+        self.arrivals_filename = arrivals_filename
+        self.start = start
+        self.end = end
+        self.cache = cache
+        self.cleaner = cleaner
+        self.pos = None
+        self.arrivals = None
+
+        if cache is None:
+            self._read_data(start, end)
+
+    def _read_data(self, start, end=None):
+        """Read schedules from the time period or the whole day of start."""
+
+        self.data = pd.read_csv(self.schedules_filename, index_col=0,
                                 dtype=self.SCHEDULE_DTYPES)
-        self.pos = pd.read_csv(positions_filename, index_col=0,
-                               dtype=self.POSITION_DTYPES)
+        if self.arrivals_filename:
+            self.arrivals = ArrivalCalculator.load(self.arrivals_filename)
+        else:
+            self.pos = self.read_positions(self.positions_filename,
+                                           cleaner=self.cleaner)
         self._prepare_data(start, end)
 
     def _prepare_data(self, start, end):
         """Parse data.
 
         Only data from the time period specified by start and end will be kept.
+        If end is not given, data of the whole day of start is kept.
         """
 
         # differentiate between vehicles based on their line and brigade
-        # (since there's no information about their numbers)
-        self.data.sort_values(['Lines', 'Brigade'], inplace=True)
+        # (since there's no information about their numbers), keeping the
+        # order of planned arrivals within line and brigade, as `_stitch` does
+        self.data.sort_values(['Lines', 'Brigade'], kind='mergesort',
+                              inplace=True)
 
         def normalize(time):
             hour = int(time[:2])
@@ -41,49 +91,156 @@ class DelayCalculator(Calculator):
         # (i.e. because two adjacent rows are representing different vehicles)
         self.data['Delay'] = np.nan
         self.data['Time'] = self.data['Time'].apply(normalize)
-        self.data = self.data[self.data['Time'].between(start, end)]
+        if end is not None:
+            self.data = self.data[self.data['Time'].between(start, end)]
+
+        if self.pos is not None:
+            self.pos['Time'] = pd.to_datetime(self.pos['Time'])
 
-        self.pos['Distance'] = np.nan
-        self.pos['Time'] = self.pos['Time'].apply(dateutil.parser.parse)
+    def sample(self, fraction, seed=None):
+        """Keep data of a stratified sample of brigades of each line."""
+
+        sampled = super().sample(fraction, seed)
+        if self.pos is not None:
+            self.pos = self._sampled(self.pos, sampled)
+        if self.arrivals is not None:
+            self.arrivals = self._sampled(self.arrivals, sampled)
+        return sampled
 
     def calculate(self):
-        """Calculate bus delays."""
-
-        # current line and brigade of interests
-        line, brigade = None, None
-        # all gathered data about current line and brigade
-        pos_line, pos_brigade = None, None
-
-        for _, row in self.data.iterrows():
-            # if adjacent rows are representing different line
-            if row['Lines'] != line:
-                line, brigade = row['Lines'], row['Brigade']
-                pos_line = self.pos[self.pos['Lines'] == line].copy()
-                pos_brigade = pos_line[pos_line['Brigade'] == brigade].copy()
-                print(f'Line {line}')
-
-            # if adjacent rows are representing same line, but different brigade
-            elif row['Brigade'] != brigade:
-                brigade = row['Brigade']
-                pos_brigade = pos_line[pos_line['Brigade'] == brigade].copy()
-
-            # consider only positions from 5 minutes before planned arrival
-            # to any time past arrival
-            time_threshold = row['Time'] - datetime.timedelta(minutes=5)
-            # consider only buses in less than 250 m from bus stop location
-            distance_threshold = 0.25
-
-            pos_brigade['Distance'] = pos_brigade.apply(
-                lambda r: self.get_distance(r, row), axis=1
+        """Calculate bus delays.
+
+        Arrival is the first time an adequate bus is in the radius of a stop,
+        but not earlier than `TIME_THRESHOLD` before planned arrival.
+        """
+
+        if self.cache is not None:
+            self.data = self._calculate_cached(self.cache, self.start, self.end)
+        else:
+            self._calculate_delays()
+
+    def _calculate_delays(self):
+        """Calculate delays of planned arrivals in data."""
+
+        if self.arrivals is None:
+            self.arrivals = ArrivalCalculator.find_arrivals(
+                self.pos, ArrivalCalculator.get_stops(self.data),
+                ordered=TrajectoryStore.is_store(self.positions_filename),
             )
-            pos = pos_brigade[(pos_brigade['Time'] >= time_threshold) &
-                              (pos_brigade['Distance'] < distance_threshold)]
-
-            # when got a match
-            if not pos.empty:
-                # choose minimum arrival time
-                arrival = pos[pos['Time'] == pos['Time'].min()].iloc[0]
-                # compute delay in minutes
-                seconds = (arrival['Time'] - row['Time']).total_seconds()
-                delay = max(seconds // 60, 0)
-                self.data.loc[row.name, 'Delay'] = delay
+
+        keys = ['Lines', 'Brigade', 'BusStopName', 'Lat', 'Lon']
+        schedule = self.data[keys + ['Time']].reset_index()
+        schedule['Threshold'] = schedule['Time'] - self.TIME_THRESHOLD
+
+        # match each planned arrival with the first visit, which lasted
+        # at least until the time threshold
+        matched = pd.merge_asof(
+            schedule.sort_values('Threshold'),
+            self.arrivals[keys + ['FirstTime', 'LastTime']]
+                .sort_values('LastTime'),
+            left_on='Threshold', right_on='LastTime', by=keys,
+            direction='forward',
+        ).set_index('index')
+
+        arrival = matched[['FirstTime', 'Threshold']].max(axis=1, skipna=False)
+        # compute delay in minutes
+        seconds = (arrival - matched['Time']).dt.total_seconds()
+        self.data['Delay'] = (seconds // 60).clip(lower=0)
+
+    def sweep(self, radii, time_thresholds, long=False):
+        """Calculate bus delays for every combination of thresholds at once.
+
+        Distances of positions from stops are computed once, for the largest
+        radius. Arrival is the first position in radius of a stop, not earlier
+        than time threshold before planned arrival. Sweep results are not
+        cached, so with cache, input files are read.
+
+        Parameters
+        ----------
+        radii : list
+            Distances in km from a stop, in which a bus is considered at it.
+        time_thresholds : list
+            Timedeltas before planned arrival, from which arrivals are considered.
+        long : bool
+            Whether to give a row per planned arrival and combination, instead
+            of a column per combination.
+        """
+
+        if self.cache is not None and self.data is None:
+            self._read_data(self.start, self.end)
+        if self.pos is None:
+            raise ValueError('Sweep requires positions, not arrival events')
+
+        keys = ['Lines', 'Brigade', 'BusStopName', 'Lat', 'Lon']
+        candidates = ArrivalCalculator.find_candidates(
+            self.pos, ArrivalCalculator.get_stops(self.data), max(radii),
+            ordered=TrajectoryStore.is_store(self.positions_filename),
+        )
+        candidates = self.data[keys + ['Time']].reset_index().merge(
+            candidates, on=keys, suffixes=('', 'Arrival')
+        )
+        offset = (candidates['TimeArrival'] -
+                  candidates['Time']).dt.total_seconds().values
+        distance = candidates['Distance'].values
+
+        # arrival offset of each candidate in each combination,
+        # reduced to the earliest one in a single pass
+        combinations = [(radius, threshold) for radius in radii
+                        for threshold in time_thresholds]
+        offsets = pd.DataFrame({
+            self._sweep_column(radius, threshold): np.where(
+                (distance < radius) &
+                (offset >= -threshold.total_seconds()), offset, np.nan
+            ) for radius, threshold in combinations
+        })
+        offsets['index'] = candidates['index']
+        delays = (offsets.groupby('index').min() // 60).clip(lower=0) \
+            .reindex(self.data.index)
+
+        data = self.data.drop(columns='Delay')
+        if not long:
+            self.data = data.join(delays)
+            return
+
+        self.data = pd.concat([
+            data.assign(Radius=radius, TimeThreshold=threshold,
+                        Delay=delays[self._sweep_column(radius, threshold)])
+            for radius, threshold in combinations
+        ])
+
+    @staticmethod
+    def _sweep_column(radius, threshold):
+        minutes = threshold.total_seconds() / 60
+        return f'Delay_{radius * 1000:g}m_{minutes:g}min'
+
+    def _inputs(self):
+        if self.arrivals_filename:
+            return [self.schedules_filename, self.arrivals_filename]
+        return [self.schedules_filename, self.positions_filename]
+
+    def _parameters(self):
+        # schedule is assigned to the day of start
+        return {
+            'date': self.start.date(),
+            'time_threshold': self.TIME_THRESHOLD,
+            'distance_threshold': ArrivalCalculator.DISTANCE_THRESHOLD,
+        }
+
+    def _calculate_partitions(self, partitions):
+        self._read_data(self.start)
+
+        # delays depend only on planned arrivals, so partitions are
+        # calculated all at once
+        hours = self.data['Time'].dt.floor(self.PARTITION)
+        self.data = self.data[hours.isin(partitions)].copy()
+        self._calculate_delays()
+
+        return {
+            partition: self.data[hours[self.data.index] == partition]
+            for partition in partitions
+        }
+
+    def _stitch(self, data, start, end):
+        data = data[data['Time'].between(start, end)].sort_index()
+        # keep the order of planned arrivals within line and brigade
+        return data.sort_values(['Lines', 'Brigade'], kind='mergesort')
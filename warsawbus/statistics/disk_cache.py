@@ -0,0 +1,48 @@
+import os
+import pickle
+
+import pandas as pd
+
+
+class DiskCache:
+    """Base class of disk caches of data frames.
+
+    Entries are pickled data frames. Missing, partial and corrupt entries
+    are all cache misses.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, dirname):
+        """Initialize DiskCache.
+
+        Parameters
+        ----------
+        dirname : str
+            Path to a cache directory. It will be created if needed.
+        """
+
+        self.dirname = dirname
+        os.makedirs(dirname, exist_ok=True)
+
+    def _hash_file(self, digest, path):
+        """Update digest with contents of a file, read in chunks."""
+
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(self.CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    @staticmethod
+    def _read(path):
+        """Read entry or None, if there is no valid one."""
+
+        try:
+            return pd.read_pickle(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    @staticmethod
+    def _write(path, data):
+        # write to temporary file first, so no partial entry is ever read
+        data.to_pickle(path + '.tmp')
+        os.replace(path + '.tmp', path)
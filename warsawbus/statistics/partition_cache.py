@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+from .disk_cache import DiskCache
+
+
+class PartitionCache(DiskCache):
+    """Disk cache of calculation results split into time partitions.
+
+    Entries are keyed by the content hash of calculation inputs and its
+    parameters, along with the start of a partition, so overlapping windows
+    share the results of partitions they have in common.
+    """
+
+    PARTITION_FORMAT = '%Y%m%d_%H%M'
+
+    def fingerprint(self, name, filenames, parameters):
+        """Get fingerprint of a calculation.
+
+        Parameters
+        ----------
+        name : str
+            Name of the calculation.
+        filenames : list
+            Input files or directories, i.e. trajectory stores.
+        parameters : dict
+        """
+
+        digest = hashlib.sha256(f'{name}|{sorted(parameters.items())}'.encode())
+        for filename in filenames:
+            for path in self._files(str(filename)):
+                self._hash_file(digest, path)
+        return digest.hexdigest()
+
+    def get(self, fingerprint, partition):
+        """Get cached partition or None, if there is no such entry."""
+
+        return self._read(self._path(fingerprint, partition))
+
+    def put(self, fingerprint, partition, data):
+        self._write(self._path(fingerprint, partition), data)
+
+    def _path(self, fingerprint, partition):
+        partition = partition.strftime(self.PARTITION_FORMAT)
+        return os.path.join(self.dirname, f'{fingerprint}_{partition}.pkl')
+
+    @staticmethod
+    def _files(path):
+        if not os.path.isdir(path):
+            return [path]
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))]
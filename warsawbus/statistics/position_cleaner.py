@@ -0,0 +1,177 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .calculator import Calculator
+
+
+class PositionCleaner:
+    """Class for removing invalid positions, before they are processed.
+
+    Four kinds of positions are removed:
+
+    * stale - reported with time older than the feed clock by more than the
+      maximum age, where the feed clock is `FetchTime` recorded by
+      `PositionFetcher`, or else the median time of positions fetched around
+      each one, so a few wrong vehicle clocks do not matter,
+    * future - reported with time newer than the feed clock by more than the
+      maximum age, i.e. by vehicles with clocks running ahead,
+    * out of bounds - outside of the area served by Warsaw public transport,
+      including zero and missing coordinates,
+    * teleports - positions, which a vehicle would have to move faster than
+      the maximum speed to and from, or either at the ends of its track.
+      Those are removed in several passes, as removing one may reveal another.
+    """
+
+    # Warsaw and its suburbs served by public transport
+    LAT_BOUNDS = (51.95, 52.55)
+    LON_BOUNDS = (20.6, 21.45)
+
+    MAX_AGE = datetime.timedelta(minutes=5)
+    # number of positions fetched around each one, which the feed clock
+    # is the median time of
+    CLOCK_WINDOW = 101
+    # km/h
+    MAX_SPEED = 120
+    MAX_PASSES = 10
+
+    def __init__(self, max_age=MAX_AGE, lat_bounds=LAT_BOUNDS,
+                 lon_bounds=LON_BOUNDS, max_speed=MAX_SPEED):
+        """Initialize PositionCleaner.
+
+        Parameters
+        ----------
+        max_age : timedelta
+            Maximum time a position can be older than the feed clock by.
+        lat_bounds : tuple
+            Minimum and maximum latitude of valid positions.
+        lon_bounds : tuple
+            Minimum and maximum longitude of valid positions.
+        max_speed : float
+            Maximum km/h speed of vehicles.
+        """
+
+        self.max_age = max_age
+        self.lat_bounds = lat_bounds
+        self.lon_bounds = lon_bounds
+        self.max_speed = max_speed
+        # number of positions removed for each reason in the latest run
+        self.removed = {}
+
+    def parameters(self):
+        """Get parameters, which cleaning results depend on."""
+
+        return {
+            'max_age': self.max_age,
+            'lat_bounds': self.lat_bounds,
+            'lon_bounds': self.lon_bounds,
+            'max_speed': self.max_speed,
+        }
+
+    def clean(self, data, ordered=False):
+        """Get valid positions.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Positions with `FetchTime`, or else in the order they were
+            fetched in.
+        ordered : bool
+            Whether data is already sorted by vehicle and time, as read from
+            a trajectory store. Fetch order is lost then, so stale and future
+            positions are looked for only by `FetchTime`.
+
+        Returns
+        -------
+        DataFrame
+            Subset of rows of data, in the original order.
+        """
+
+        time = pd.to_datetime(data['Time']).values
+
+        stale = np.zeros(len(data), dtype=bool)
+        future = np.zeros(len(data), dtype=bool)
+        clock = None
+        if 'FetchTime' in data.columns:
+            clock = pd.to_datetime(data['FetchTime']).values
+        elif not ordered:
+            clock = self._clock(time, data['VehicleNumber'].values)
+        if clock is not None:
+            max_age = np.timedelta64(self.max_age)
+            stale = time < clock - max_age
+            future = time > clock + max_age
+        self.removed = {'stale': int(stale.sum()), 'future': int(future.sum())}
+        valid = ~stale & ~future
+
+        lat, lon = data['Lat'].values, data['Lon'].values
+        inside = (lat >= self.lat_bounds[0]) & (lat <= self.lat_bounds[1]) & \
+            (lon >= self.lon_bounds[0]) & (lon <= self.lon_bounds[1])
+        self.removed['bounds'] = int((valid & ~inside).sum())
+        valid &= inside
+
+        teleports = self._teleports(data['VehicleNumber'].values, time, lat,
+                                    lon, valid)
+        self.removed['teleport'] = int(teleports.sum())
+        valid &= ~teleports
+
+        return data[valid]
+
+    def _clock(self, time, vehicle):
+        """Get the feed clock at each position in fetch order.
+
+        Raises
+        ------
+        ValueError
+            If positions are not in fetch order, i.e. sorted by vehicle, so
+            mostly the same vehicle is fetched in a row, or joined from
+            several files, so the clock goes back in time.
+        """
+
+        seconds = pd.Series(time.astype('datetime64[s]').astype(np.int64))
+        median = seconds.rolling(self.CLOCK_WINDOW, min_periods=1,
+                                 center=True).median().values
+
+        repeated = (vehicle[1:] == vehicle[:-1]).mean() if len(vehicle) > 1 \
+            else 0
+        back = np.maximum.accumulate(median) - median > \
+            self.max_age.total_seconds()
+        if repeated > 0.5 or back.any():
+            raise ValueError('Positions without FetchTime have to be in '
+                             'fetch order')
+        return median.astype(np.int64).astype('datetime64[s]')
+
+    def _teleports(self, vehicle, time, lat, lon, valid):
+        """Get mask of positions impossible to reach at the maximum speed."""
+
+        index = np.flatnonzero(valid)
+        order = index[np.lexsort((time[index], vehicle[index]))]
+        teleports = np.zeros(len(vehicle), dtype=bool)
+
+        for _ in range(self.MAX_PASSES):
+            same = vehicle[order][1:] == vehicle[order][:-1]
+            distance = Calculator.get_distances(
+                lat[order][:-1], lon[order][:-1], lat[order][1:], lon[order][1:]
+            )
+            hours = (time[order][1:] - time[order][:-1]) / np.timedelta64(1, 'h')
+            with np.errstate(divide='ignore', invalid='ignore'):
+                impossible = same & (distance / hours > self.max_speed)
+
+            # impossible moves into and out of each position
+            into = np.append(False, impossible)
+            out = np.append(impossible, False)
+            spikes = into & out
+            # ends of tracks are removed, unless their neighbour is a spike,
+            # which is to be removed first
+            first = np.append(True, ~same) & out & \
+                ~np.append(spikes[1:], False)
+            last = np.append(~same, True) & into & \
+                ~np.append(False, spikes[:-1])
+            removed = spikes | first | last
+            if not removed.any():
+                break
+
+            teleports[order[removed]] = True
+            order = order[~removed]
+
+        return teleports
@@ -5,44 +5,156 @@ import dateutil.parser
 import numpy as np
 import pandas as pd
 
+from .trajectory_store import TrajectoryStore
+
 
 class SpeedCalculator(Calculator):
     """Class for calculating bus speed statistics."""
 
-    def __init__(self, positions_filename, start, end):
+    UNIT_COLUMNS = ['VehicleNumber']
+
+    def __init__(self, positions_filename, start, end, cache=None,
+                 cleaner=None):
+        """Initialize SpeedCalculator.
+
+        Parameters
+        ----------
+        positions_filename : str
+            Positions .csv file or trajectory store directory.
+        start : datetime
+        end : datetime
+        cache : PartitionCache, optional
+            Cache of hourly partitions of results. With cache, positions are
+            read only if some partitions are missing.
+        cleaner : PositionCleaner, optional
+            Cleaner removing invalid positions, before speed is calculated.
+        """
+
         super().__init__()
-        self.data = pd.read_csv(positions_filename, index_col=0,
-                                dtype=self.POSITION_DTYPES)
-        self._prepare_data(start, end)
+        self.positions_filename = positions_filename
+        self.start = start
+        self.end = end
+        self.cache = cache
+        self.cleaner = cleaner
+
+        if cache is None:
+            self._read_data(start, end)
+
+    def _read_data(self, start=None, end=None):
+        """Read positions from the time period or all of them."""
 
-    def _prepare_data(self, start, end):
+        self.data = self.read_positions(self.positions_filename, start, end,
+                                        self.cleaner)
+        self._prepare_data(start, end, ordered=TrajectoryStore.is_store(
+            self.positions_filename
+        ))
+
+    def _prepare_data(self, start, end, ordered=False):
         """Parse data.
 
         Only data from the time period specified by start and end will be kept.
+        Ordered data is expected to be already sorted, parsed and limited to
+        the time period.
         """
 
-        self.data.sort_values(['VehicleNumber', 'Time'], inplace=True)
-
         # differentiate between distance 0 and non-computed one
         self.data['Distance'] = np.nan
         self.data['Speed'] = np.nan
+        if ordered:
+            return
+
+        self.data.sort_values(['VehicleNumber', 'Time'], inplace=True)
         self.data['Time'] = self.data['Time'].apply(dateutil.parser.parse)
-        self.data = self.data[self.data['Time'].between(start, end)]
+        if start is not None:
+            self.data = self.data[self.data['Time'].between(start, end)]
 
     def calculate(self):
         """Calculate speed."""
 
-        for i in range(len(self.data) - 1):
-            row1, row2 = self.data.iloc[i], self.data.iloc[i + 1]
+        if self.cache is not None:
+            self.data = self._calculate_cached(self.cache, self.start, self.end)
+        else:
+            self._calculate_speeds(self.data)
+
+    def _calculate_speeds(self, data):
+        """Calculate speed of positions ordered by vehicle and time."""
+
+        for i in range(len(data) - 1):
+            row1, row2 = data.iloc[i], data.iloc[i + 1]
 
             # skip different vehicles
             if row1['VehicleNumber'] != row2['VehicleNumber']:
                 continue
 
             distance = self.get_distance(row1, row2)
-            self.data.loc[row2.name, 'Distance'] = distance
+            data.loc[row2.name, 'Distance'] = distance
 
             time_delta = row2['Time'] - row1['Time']
             # seconds to hours, so speed would be in km/h
             time_delta = time_delta.total_seconds() / 3600
-            self.data.loc[row2.name, 'Speed'] = distance / time_delta
+            data.loc[row2.name, 'Speed'] = distance / time_delta
+
+    @classmethod
+    def get_speeds(cls, previous, current):
+        """Get speeds of vehicles between their previous and current positions.
+
+        Vectorized, so it keeps up with live data of the whole fleet.
+        Vehicles, which did not report a new position, keep their previous
+        speed. Vehicles reported more than once are kept only once, with
+        their last position.
+
+        Parameters
+        ----------
+        previous : DataFrame
+            Previous positions, along with their `Speed`.
+        current : DataFrame
+        """
+
+        columns = ['Lat', 'Lon', 'Time', 'Speed']
+        previous = previous.drop_duplicates('VehicleNumber', keep='last')
+        current = current.drop_duplicates('VehicleNumber', keep='last')
+        previous = previous.set_index('VehicleNumber')[columns] \
+            .add_suffix('Previous')
+        data = current.join(previous, on='VehicleNumber')
+
+        distance = cls.get_distances(data['LatPrevious'], data['LonPrevious'],
+                                     data['Lat'], data['Lon'])
+        # seconds to hours, so speed would be in km/h
+        hours = (pd.to_datetime(data['Time']) -
+                 pd.to_datetime(data['TimePrevious'])).dt.total_seconds() / 3600
+        data['Speed'] = (distance / hours).where(hours > 0) \
+            .where(hours != 0, data['SpeedPrevious'])
+
+        return data[list(current.columns) + ['Speed']]
+
+    def _inputs(self):
+        return [self.positions_filename]
+
+    def _calculate_partitions(self, partitions):
+        self._read_data()
+        results = {}
+
+        for partition in partitions:
+            time = self.data['Time']
+            rows = self.data[(time >= partition) &
+                             (time < partition + self.PARTITION)]
+            # last position of each vehicle before the partition, so speed
+            # of its first position in the partition is calculated as well
+            before = self.data[time < partition] \
+                .groupby('VehicleNumber').tail(1)
+
+            data = pd.concat([before, rows]) \
+                .sort_values(['VehicleNumber', 'Time'])
+            self._calculate_speeds(data)
+            results[partition] = data.loc[rows.index]
+
+        return results
+
+    def _stitch(self, data, start, end):
+        data = data[data['Time'].between(start, end)] \
+            .sort_values(['VehicleNumber', 'Time'])
+
+        # first position of each vehicle in the time period has no previous one
+        first = ~data['VehicleNumber'].duplicated()
+        data.loc[first, ['Distance', 'Speed']] = np.nan
+        return data
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from .calculator import Calculator
+
+
+class StopIndex:
+    """Class for finding the nearest stop of positions as they are fetched.
+
+    Stops are hashed into a grid of cells as large as the radius, sorted by
+    their cell. The nearest stop in radius is looked for only in the cell of
+    a position and its 8 neighbours, found by binary search, all at once for
+    a whole response.
+    """
+
+    # consider only stops in less than 50 m from a position
+    DISTANCE_THRESHOLD = 0.05
+    NEIGHBOURS = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)]
+
+    def __init__(self, stops, radius=DISTANCE_THRESHOLD):
+        """Initialize StopIndex.
+
+        Parameters
+        ----------
+        stops : DataFrame
+            Stops with `StopId`, `Lat` and `Lon` columns. Stops without valid
+            coordinates are left out.
+        radius : float
+            Distance in km from a stop, in which a position is tagged with it.
+        """
+
+        stops = stops[np.isfinite(stops['Lat'].astype(float)) &
+                      np.isfinite(stops['Lon'].astype(float))]
+        self.radius = radius
+        self.cell_lat = radius / Calculator.DEGREE
+        # cells are at least as wide as the radius up to the northernmost stop
+        north = np.abs(stops['Lat']).max() if len(stops) else 0
+        self.cell_lon = radius / (Calculator.DEGREE *
+                                  np.cos(np.radians(north + self.cell_lat)))
+
+        keys = self._keys(stops['Lat'].values, stops['Lon'].values)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.ids = stops['StopId'].values[order]
+        self.lat = stops['Lat'].values[order].astype(float)
+        self.lon = stops['Lon'].values[order].astype(float)
+
+    @classmethod
+    def from_stops(cls, stops, radius=DISTANCE_THRESHOLD):
+        """Build index of stops of `ScheduleFetcher`.
+
+        Stop posts are identified by stop group and post number, i.e. '7009_01'.
+        """
+
+        stops = pd.DataFrame({
+            'StopId': [f'{stop["zespol"]}_{stop["slupek"]}' for stop in stops],
+            'Lat': [float(stop['szer_geo']) for stop in stops],
+            'Lon': [float(stop['dlug_geo']) for stop in stops],
+        })
+        return cls(stops, radius)
+
+    @classmethod
+    def from_schedules(cls, filename, radius=DISTANCE_THRESHOLD):
+        """Build index of stops in a schedules file.
+
+        Schedules do not identify posts, so stops are identified by their
+        names, the same way as by `ArrivalCalculator` and `DelayCalculator`.
+        """
+
+        schedules = pd.read_csv(filename, index_col=0,
+                                dtype=Calculator.SCHEDULE_DTYPES)
+        stops = schedules[['BusStopName', 'Lat', 'Lon']].drop_duplicates() \
+            .rename(columns={'BusStopName': 'StopId'})
+        return cls(stops, radius)
+
+    def lookup(self, lat, lon):
+        """Get the nearest stop in radius of each position.
+
+        Parameters
+        ----------
+        lat : ndarray
+        lon : ndarray
+
+        Returns
+        -------
+        tuple
+            Stop identifiers, None if there is no stop in radius, and km
+            distances from them, NaN if there is no stop in radius. Positions
+            without valid coordinates have no stop in radius.
+        """
+
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        ids = np.full(len(lat), None, dtype=object)
+        distances = np.full(len(lat), np.nan)
+
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        lat, lon = lat[valid], lon[valid]
+
+        # range of stops in each neighbouring cell of each position
+        row, column = self._cells(lat, lon)
+        cells = np.stack([self._key(row + i, column + j)
+                          for i, j in self.NEIGHBOURS], axis=1).ravel()
+        left = np.searchsorted(self.keys, cells, 'left')
+        counts = np.searchsorted(self.keys, cells, 'right') - left
+
+        # pairs of positions and stops from those ranges
+        total = counts.sum()
+        point = np.repeat(np.repeat(np.arange(len(lat)), len(self.NEIGHBOURS)),
+                          counts)
+        stop = np.repeat(left, counts) + np.arange(total) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+
+        distance = Calculator.get_distances(lat[point], lon[point],
+                                            self.lat[stop], self.lon[stop])
+        inside = distance < self.radius
+        point, stop, distance = point[inside], stop[inside], distance[inside]
+
+        # the nearest stop comes first for each position
+        order = np.lexsort((distance, point))
+        point, first = np.unique(point[order], return_index=True)
+        ids[valid[point]] = self.ids[stop[order][first]]
+        distances[valid[point]] = distance[order][first]
+        return ids, distances
+
+    def tag(self, positions):
+        """Add `StopId` and `StopDistance` to each position in place.
+
+        Parameters
+        ----------
+        positions : list
+            Positions as dicts with `Lat` and `Lon`.
+        """
+
+        # missing coordinates are NaN
+        lat = np.array([position['Lat'] for position in positions], dtype=float)
+        lon = np.array([position['Lon'] for position in positions], dtype=float)
+        ids, distances = self.lookup(lat, lon)
+
+        for position, stop_id, distance in zip(positions, ids, distances):
+            position['StopId'] = stop_id
+            position['StopDistance'] = None if np.isnan(distance) else \
+                round(float(distance), 4)
+
+    def _cells(self, lat, lon):
+        return (np.floor(lat / self.cell_lat).astype(np.int64),
+                np.floor(lon / self.cell_lon).astype(np.int64))
+
+    def _keys(self, lat, lon):
+        return self._key(*self._cells(lat, lon))
+
+    @staticmethod
+    def _key(row, column):
+        # columns are far less than 2 ** 31 from 0, so keys are unique
+        return (row << 32) + column
@@ -1,12 +1,21 @@
 import copy
+import datetime
 import dateutil.parser
+import unittest.mock
 
 import numpy as np
 import pandas as pd
+import pytest
 
+from .arrival_calculator import ArrivalCalculator
 from .calculator import Calculator
 from .delay_calculator import DelayCalculator
+from .partition_cache import PartitionCache
+from .position_cleaner import PositionCleaner
 from .speed_calculator import SpeedCalculator
+from .stop_index import StopIndex
+from .trajectory_simplifier import TrajectorySimplifier
+from .trajectory_store import TrajectoryStore
 
 
 class TestBaseCalculator:
@@ -18,6 +27,18 @@ class TestBaseCalculator:
         assert calculator.get_distance({'Lat': 20, 'Lon': 20},
                                        {'Lat': 21, 'Lon': 21}) > 0
 
+    def test_distances(self):
+        calculator = Calculator()
+        distances = calculator.get_distances(np.array([52.2, 52.2]),
+                                             np.array([21.0, 21.0]),
+                                             np.array([52.2, 52.3]),
+                                             np.array([21.0, 21.1]))
+
+        expected = calculator.get_distance({'Lat': 52.2, 'Lon': 21.0},
+                                           {'Lat': 52.3, 'Lon': 21.1})
+        assert distances[0] == 0
+        assert abs(distances[1] - expected) / expected < 0.005
+
 
 class TestSpeedCalculator:
     def test_calculate(self, tmpdir):
@@ -55,6 +76,41 @@ class TestSpeedCalculator:
 
         assert (calculator.data.fillna(0) == expected_data).all(axis=None)
 
+    def test_get_speeds(self):
+        previous = pd.DataFrame([{
+            'VehicleNumber': str(i),
+            'Lat': 52.2,
+            'Lon': 21.0,
+            'Time': '2021-02-02 16:00:00',
+            'Speed': 20.0,
+        } for i in range(3)])
+        current = pd.DataFrame([{
+            'VehicleNumber': str(i),
+            'Lat': 52.2 + 0.01 * i,
+            'Lon': 21.0,
+            'Time': f'2021-02-02 16:0{i}:00',
+        } for i in range(4)])
+
+        speeds = SpeedCalculator.get_speeds(previous, current)['Speed']
+        assert speeds[0] == 20
+        assert abs(speeds[1] - 66.7) < 0.1
+        assert abs(speeds[2] - 66.7) < 0.1
+        assert np.isnan(speeds[3])
+
+    def test_get_speeds_duplicates(self):
+        current = pd.DataFrame([{
+            'VehicleNumber': '1',
+            'Lat': 52.2 + 0.01 * i,
+            'Lon': 21.0,
+            'Time': f'2021-02-02 16:0{i}:00',
+        } for i in range(2)])
+
+        latest = current.assign(Speed=np.nan)
+        for _ in range(3):
+            latest = SpeedCalculator.get_speeds(latest, current)
+        assert len(latest) == 1
+        assert latest['Lat'].iloc[0] == 52.21
+
 
 class TestDelayCalculator:
     def test_calculate(self, tmpdir):
@@ -97,3 +153,708 @@ class TestDelayCalculator:
         calculator.calculate()
 
         assert (calculator.data.fillna(0) == expected_data).all(axis=None)
+
+
+class TestArrivalCalculator:
+    STOPS = [('Banacha', 52.21), ('Pole Mokotowskie', 52.22)]
+
+    def write_data(self, tmpdir):
+        schedules = [{
+            'Lines': '100',
+            'Lat': lat,
+            'Lon': 21.0,
+            'Brigade': '1',
+            'BusStopName': name,
+            'Time': '16:00:00',
+        } for name, lat in self.STOPS]
+
+        # single bus moving north by ~110 m every minute, there and back
+        positions = [{
+            'Lines': '100',
+            'Lat': 52.2 + 0.001 * min(i, 60 - i),
+            'Lon': 21.0,
+            'VehicleNumber': '1000',
+            'Time': dateutil.parser.parse(f'2021-02-02 16:{i:02d}:00'),
+            'Brigade': '1',
+        } for i in range(60)]
+
+        pd.DataFrame(schedules).to_csv(tmpdir / 'schedules.csv')
+        pd.DataFrame(positions).to_csv(tmpdir / 'positions.csv')
+
+    def test_calculate(self, tmpdir):
+        self.write_data(tmpdir)
+
+        calculator = ArrivalCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+        )
+        calculator.calculate()
+
+        data = calculator.data.sort_values('FirstTime')
+        assert list(data['BusStopName']) == ['Banacha', 'Pole Mokotowskie',
+                                             'Pole Mokotowskie', 'Banacha']
+        # bus enters the radius 2 minutes before being at the stop
+        assert list(data['FirstTime'].dt.minute) == [8, 18, 38, 48]
+        assert list(data['ClosestTime'].dt.minute) == [10, 20, 40, 50]
+        assert list(data['LastTime'].dt.minute) == [12, 22, 42, 52]
+
+        travel_times = ArrivalCalculator.travel_times(calculator.data)
+        assert list(travel_times['TravelTime']) == [10, 20, 10]
+
+        headways = ArrivalCalculator.headways(calculator.data)
+        assert sorted(headways['Headway'].dropna()) == [20, 40]
+
+    def test_delays_from_arrivals(self, tmpdir):
+        self.write_data(tmpdir)
+
+        calculator = ArrivalCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+        )
+        calculator.calculate()
+        calculator.save(tmpdir / 'arrivals.csv')
+
+        kwargs = {
+            'schedules_filename': tmpdir / 'schedules.csv',
+            'positions_filename': tmpdir / 'positions.csv',
+            'start': dateutil.parser.parse('2021-02-02 16:00:00'),
+            'end': dateutil.parser.parse('2021-02-02 17:00:00'),
+        }
+        from_positions = DelayCalculator(**kwargs)
+        from_positions.calculate()
+
+        kwargs['positions_filename'] = None
+        from_arrivals = DelayCalculator(
+            arrivals_filename=tmpdir / 'arrivals.csv', **kwargs
+        )
+        from_arrivals.calculate()
+
+        assert list(from_arrivals.data['Delay']) == [8, 18]
+        assert (from_arrivals.data == from_positions.data).all(axis=None)
+
+    def test_sweep(self, tmpdir):
+        self.write_data(tmpdir)
+        schedules = pd.read_csv(tmpdir / 'schedules.csv', index_col=0)
+        schedules.loc[0, 'Time'] = '16:15:00'
+        schedules.to_csv(tmpdir / 'schedules.csv')
+
+        calculator = DelayCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 17:00:00'),
+        )
+        calculator.sweep(radii=[0.15, 0.25],
+                         time_thresholds=[datetime.timedelta(minutes=1),
+                                          datetime.timedelta(minutes=5)])
+
+        assert calculator.data.filter(like='Delay').to_dict('list') == {
+            'Delay_150m_1min': [34, 19],
+            'Delay_150m_5min': [0, 19],
+            'Delay_250m_1min': [33, 18],
+            'Delay_250m_5min': [0, 18],
+        }
+
+        calculator.calculate()
+        assert list(calculator.data['Delay']) == [0, 18]
+
+    def test_sweep_long(self, tmpdir):
+        self.write_data(tmpdir)
+
+        calculator = DelayCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 17:00:00'),
+        )
+        calculator.sweep(radii=[0.15, 0.35],
+                         time_thresholds=[datetime.timedelta(minutes=5)],
+                         long=True)
+
+        assert list(calculator.data['Radius']) == [0.15, 0.15, 0.35, 0.35]
+        assert list(calculator.data['Delay']) == [9, 19, 7, 17]
+
+    def test_sweep_cached(self, tmpdir):
+        self.write_data(tmpdir)
+
+        calculator = DelayCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 17:00:00'),
+            cache=PartitionCache(tmpdir / 'cache'),
+        )
+        calculator.sweep(radii=[0.15, 0.35],
+                         time_thresholds=[datetime.timedelta(minutes=5)],
+                         long=True)
+
+        assert list(calculator.data['Delay']) == [9, 19, 7, 17]
+
+
+class TestTrajectoryStore:
+    @staticmethod
+    def get_positions():
+        positions = []
+        for vehicle in range(3):
+            for i in range(1000):
+                positions.append({
+                    'Lines': str(100 + (vehicle + i // 400) % 2),
+                    # coordinates stored losslessly with micro degrees
+                    'Lat': round(52.2 + ((i * 37 + vehicle) % 1000) / 10 ** 6,
+                                 6),
+                    'Lon': round(21.0 - ((i * 91) % 1000) / 10 ** 6, 6),
+                    'VehicleNumber': str(1000 + vehicle),
+                    'Time': dateutil.parser.parse('2021-02-02 16:00:00') +
+                    datetime.timedelta(seconds=15 * i + vehicle),
+                    'Brigade': str(i // 400),
+                })
+        return pd.DataFrame(positions).sample(frac=1, random_state=0)
+
+    def test_slice(self, tmpdir):
+        positions = self.get_positions()
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+        store = TrajectoryStore.load(tmpdir / 'store')
+
+        expected = positions.sort_values(['VehicleNumber', 'Time']) \
+            .reset_index(drop=True)
+        data = store.slice()
+        assert (data[expected.columns] == expected).all(axis=None)
+
+        start = dateutil.parser.parse('2021-02-02 16:30:00')
+        end = dateutil.parser.parse('2021-02-02 17:30:01')
+        data = store.slice(vehicle='1001', start=start, end=end)
+        selected = expected[(expected['VehicleNumber'] == '1001') &
+                            expected['Time'].between(start, end)]
+        assert len(data) == 241
+        assert (data[expected.columns].values == selected.values).all()
+
+        data = store.slice(line='101', brigade='0', start=start)
+        selected = expected[(expected['Lines'] == '101') &
+                            (expected['Brigade'] == '0') &
+                            (expected['Time'] >= start)]
+        assert (data[expected.columns].values == selected.values).all()
+
+        assert store.slice(vehicle='foo').empty
+
+    def test_columns(self, tmpdir):
+        positions = self.get_positions()
+        positions.loc[positions.index[:10], 'Brigade'] = None
+        positions['StopId'] = np.where(positions.index % 3, None, '420_0')
+        positions['StopDistance'] = np.where(positions.index % 3, np.nan,
+                                             0.01)
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+        store = TrajectoryStore.load(tmpdir / 'store')
+
+        expected = positions.sort_values(['VehicleNumber', 'Time']) \
+            .reset_index(drop=True)
+        data = store.slice()
+        assert sorted(data.columns) == sorted(expected.columns)
+        assert data[expected.columns].equals(expected)
+        assert data['Brigade'].isna().sum() == 10
+        assert store.slice(line='100', brigade='nan').empty
+
+        positions.loc[positions.index[0], 'Lat'] = np.nan
+        with pytest.raises(ValueError):
+            TrajectoryStore.from_frame(positions)
+
+    def test_window(self, tmpdir):
+        positions = self.get_positions()
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+        store = TrajectoryStore.load(tmpdir / 'store')
+
+        start = dateutil.parser.parse('2021-02-02 18:00:00')
+        end = dateutil.parser.parse('2021-02-02 18:02:00')
+        decode = TrajectoryStore._decode
+        with unittest.mock.patch.object(TrajectoryStore, '_decode',
+                                        autospec=True,
+                                        side_effect=decode) as mock:
+            data = store.slice(start=start, end=end)
+
+        expected = positions.sort_values(['VehicleNumber', 'Time'])
+        expected = expected[expected['Time'].between(start, end)] \
+            .reset_index(drop=True)
+        assert len(data) == len(expected) == 25
+        assert (data[expected.columns] == expected).all(axis=None)
+
+        # only blocks of each track overlapping the window, out of 12
+        blocks = mock.call_args.args[3]
+        assert len(blocks) <= 2 * 3
+
+    def test_speed_calculator(self, tmpdir):
+        positions = self.get_positions()
+        positions.to_csv(tmpdir / 'positions.csv')
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+
+        kwargs = {
+            'start': dateutil.parser.parse('2021-02-02 16:30:00'),
+            'end': dateutil.parser.parse('2021-02-02 17:00:00'),
+        }
+        from_csv = SpeedCalculator(positions_filename=tmpdir / 'positions.csv',
+                                   **kwargs)
+        from_store = SpeedCalculator(positions_filename=tmpdir / 'store',
+                                     **kwargs)
+
+        expected = from_csv.data.reset_index(drop=True)
+        assert (from_store.data[expected.columns].fillna(0) ==
+                expected.fillna(0)).all(axis=None)
+
+
+    def test_arrival_calculator(self, tmpdir):
+        TestArrivalCalculator().write_data(tmpdir)
+        positions = pd.read_csv(tmpdir / 'positions.csv', index_col=0,
+                                dtype=Calculator.POSITION_DTYPES)
+        positions['Time'] = pd.to_datetime(positions['Time'])
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+
+        from_csv = ArrivalCalculator(schedules_filename=tmpdir / 'schedules.csv',
+                                     positions_filename=tmpdir / 'positions.csv')
+        from_csv.calculate()
+        from_store = ArrivalCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'store',
+        )
+        # positions read from a store are not sorted again
+        with unittest.mock.patch.object(pd.DataFrame, 'sort_values') as mock:
+            from_store.calculate()
+            mock.assert_not_called()
+
+        pd.testing.assert_frame_equal(from_store.data, from_csv.data)
+
+
+class TestStopIndex:
+    @staticmethod
+    def get_stops():
+        rng = np.random.default_rng(0)
+        return pd.DataFrame({
+            'StopId': [f'{i}_01' for i in range(2000)],
+            'Lat': rng.uniform(52.1, 52.35, 2000),
+            'Lon': rng.uniform(20.85, 21.25, 2000),
+        })
+
+    def test_lookup(self):
+        stops = self.get_stops()
+        index = StopIndex(stops, radius=0.3)
+
+        rng = np.random.default_rng(1)
+        lat = rng.uniform(52.1, 52.35, 3000)
+        lon = rng.uniform(20.85, 21.25, 3000)
+        ids, distances = index.lookup(lat, lon)
+
+        # same as the nearest stop found by brute force
+        for i in range(0, 3000, 10):
+            all_distances = Calculator.DEGREE * np.hypot(
+                stops['Lat'].values - lat[i],
+                (stops['Lon'].values - lon[i]) * np.cos(np.radians(lat[i]))
+            )
+            nearest = all_distances.argmin()
+            if all_distances[nearest] < 0.299:
+                assert ids[i] == stops['StopId'][nearest]
+                assert abs(distances[i] - all_distances[nearest]) < 0.001
+            elif all_distances[nearest] > 0.301:
+                assert ids[i] is None
+                assert np.isnan(distances[i])
+        assert 0 < (ids != None).sum() < 3000  # noqa: E711
+
+    def test_missing_coordinates(self):
+        stops = self.get_stops()
+        stops.loc[0, 'Lat'] = np.nan
+        index = StopIndex(stops, radius=0.3)
+        assert len(index.ids) == len(stops) - 1
+
+        lat = [stops['Lat'][1], np.nan, np.inf, stops['Lat'][1]]
+        lon = [stops['Lon'][1], stops['Lon'][1], 21.0, np.nan]
+        with np.errstate(all='raise'):
+            ids, distances = index.lookup(lat, lon)
+        assert list(ids) == ['1_01', None, None, None]
+        assert distances[0] == 0 and np.isnan(distances[1:]).all()
+
+    def test_from_schedules(self, tmpdir):
+        pd.DataFrame([{
+            'Lines': '100', 'Lon': 21.0, 'Lat': 52.2, 'Brigade': str(i),
+            'BusStopName': 'Banacha', 'Time': '17:00:00',
+        } for i in range(3)]).to_csv(tmpdir / 'schedules.csv')
+
+        index = StopIndex.from_schedules(tmpdir / 'schedules.csv')
+        ids, _ = index.lookup([52.2, 52.3], [21.0, 21.0])
+        assert list(ids) == ['Banacha', None]
+
+
+class TestTrajectorySimplifier:
+    @staticmethod
+    def get_positions():
+        start = dateutil.parser.parse('2021-02-02 16:00:00')
+        rng = np.random.default_rng(0)
+        positions = []
+        for vehicle in range(2):
+            for i in range(240):
+                # north, then east, then standing still with GPS noise
+                step = min(i, 80)
+                lat = 52.2 + 0.0005 * min(step, 40)
+                lon = 21.0 + 0.0005 * max(step - 40, 0) + 0.01 * vehicle
+                if i > 80:
+                    lat += rng.normal(0, 0.00001)
+                    lon += rng.normal(0, 0.00001)
+                positions.append({
+                    'Lines': '100',
+                    'Lat': lat,
+                    'Lon': lon,
+                    'VehicleNumber': str(1000 + vehicle),
+                    'Time': str(start + datetime.timedelta(seconds=15 * i)),
+                    'Brigade': '1',
+                })
+        return pd.DataFrame(positions).sample(frac=1, random_state=0)
+
+    @staticmethod
+    def get_lengths(positions):
+        positions = positions.sort_values(['VehicleNumber', 'Time'])
+        grouped = positions.groupby('VehicleNumber')
+        distances = Calculator.get_distances(
+            grouped['Lat'].shift().values, grouped['Lon'].shift().values,
+            positions['Lat'].values, positions['Lon'].values
+        )
+        return pd.Series(distances).groupby(
+            positions['VehicleNumber'].values).sum()
+
+    def test_simplify(self):
+        positions = self.get_positions()
+        simplifier = TrajectorySimplifier(tolerance=0.01, max_gap=None)
+        data = simplifier.simplify(positions)
+
+        assert data.index.is_monotonic_increasing
+        assert (data.loc[data.index] == positions.loc[data.index]).all(axis=None)
+        # start, corner, end of the drive and both ends of the stop
+        for vehicle, track in data.groupby('VehicleNumber'):
+            times = set(track['Time'])
+            for i in [0, 40, 80, 239]:
+                assert str(dateutil.parser.parse('2021-02-02 16:00:00') +
+                           datetime.timedelta(seconds=15 * i)) in times
+            assert len(track) < 10
+        assert simplifier.removed['stationary'] > 300
+        assert sum(simplifier.removed.values()) == len(positions) - len(data)
+
+        # noise of the stop is not counted, only the drive
+        lengths = self.get_lengths(data)
+        drive = self.get_lengths(positions[positions['Time'] <=
+                                           '2021-02-02 16:20:00'])
+        assert ((lengths - drive).abs() < 0.01 * drive).all()
+
+    def test_max_gap(self):
+        positions = self.get_positions()
+        data = TrajectorySimplifier(max_gap=60).simplify(positions)
+
+        data = data[data['Time'] <= '2021-02-02 16:20:00'] \
+            .sort_values(['VehicleNumber', 'Time'])
+        gaps = pd.to_datetime(data['Time']).groupby(data['VehicleNumber']) \
+            .diff().dt.total_seconds()
+        assert gaps.max() <= 60
+        assert len(data) < len(positions) / 3
+
+    def test_stops(self):
+        start = dateutil.parser.parse('2021-02-02 16:00:00')
+        # 44 km/h straight north past 20 stops
+        positions = pd.DataFrame({
+            'Lines': '100',
+            'Brigade': '1',
+            'VehicleNumber': '1000',
+            'Lat': 52.1 + np.arange(400) * 0.183 / 111.195,
+            'Lon': 21.0,
+            'Time': [start + datetime.timedelta(seconds=15 * i)
+                     for i in range(400)],
+        })
+        stops = pd.DataFrame({
+            'Lines': '100',
+            'BusStopName': [f'Stop {i}' for i in range(20)],
+            'Lat': 52.16 + np.arange(20) * 0.029,
+            'Lon': 21.0005,
+        })
+        stop_index = StopIndex(stops.rename(columns={'BusStopName': 'StopId'}),
+                               radius=ArrivalCalculator.DISTANCE_THRESHOLD)
+
+        data = TrajectorySimplifier(stop_index=stop_index).simplify(positions)
+        assert len(data) < len(positions) / 2
+
+        expected = ArrivalCalculator.find_arrivals(positions, stops)
+        arrivals = ArrivalCalculator.find_arrivals(data, stops)
+        assert len(expected) == 20
+        columns = ['BusStopName', 'FirstTime', 'LastTime']
+        assert (arrivals[columns] == expected[columns]).all(axis=None)
+
+
+class TestPositionCleaner:
+    @staticmethod
+    def get_positions():
+        start = dateutil.parser.parse('2021-02-02 16:00:00')
+        positions = []
+        for i in range(40):
+            for vehicle in range(3):
+                # 200 m every 15 s, so 48 km/h
+                positions.append({
+                    'Lines': '100',
+                    'Lat': 52.2 + 0.0018 * i,
+                    'Lon': 21.0 + 0.01 * vehicle,
+                    'VehicleNumber': str(1000 + vehicle),
+                    'Time': str(start + datetime.timedelta(seconds=15 * i)),
+                    'Brigade': str(vehicle),
+                })
+        return pd.DataFrame(positions)
+
+    def test_clean(self):
+        positions = self.get_positions()
+        # stale position fetched along with current ones
+        positions.loc[60, 'Time'] = '2021-02-02 15:00:00'
+        # zero coordinates
+        positions.loc[61, ['Lat', 'Lon']] = 0
+        # spike in the middle of a track and at its start
+        positions.loc[62, 'Lon'] = 21.1
+        positions.loc[0, 'Lat'] = 52.3
+
+        cleaner = PositionCleaner()
+        data = cleaner.clean(positions)
+
+        assert cleaner.removed == {'stale': 1, 'future': 0, 'bounds': 1,
+                                   'teleport': 2}
+        assert list(data.index) == [i for i in positions.index
+                                    if i not in [0, 60, 61, 62]]
+
+    def test_future_clock(self):
+        positions = self.get_positions()
+        # vehicle with a clock running an hour ahead early on
+        positions.loc[4, 'Time'] = '2021-02-02 17:00:15'
+        positions.loc[60, 'Time'] = '2021-02-02 15:00:00'
+
+        cleaner = PositionCleaner()
+        data = cleaner.clean(positions)
+
+        assert cleaner.removed == {'stale': 1, 'future': 1, 'bounds': 0,
+                                   'teleport': 0}
+        assert list(data.index) == [i for i in positions.index
+                                    if i not in [4, 60]]
+
+    def test_fetch_time(self):
+        positions = self.get_positions()
+        positions['FetchTime'] = positions['Time']
+        positions.loc[60, 'Time'] = '2021-02-02 15:00:00'
+        positions.loc[4, 'Time'] = '2021-02-02 17:00:15'
+        # order of fetching does not matter with fetch time
+        positions = positions.sort_values(['VehicleNumber', 'Time'])
+
+        cleaner = PositionCleaner()
+        data = cleaner.clean(positions)
+
+        assert cleaner.removed == {'stale': 1, 'future': 1, 'bounds': 0,
+                                   'teleport': 0}
+        assert sorted(data.index) == [i for i in range(len(positions))
+                                      if i not in [4, 60]]
+
+    def test_not_fetch_order(self):
+        positions = self.get_positions()
+        later = positions.assign(Time=(pd.to_datetime(positions['Time']) +
+                                       datetime.timedelta(hours=1)).astype(str))
+
+        # files of the next and the previous hour joined
+        with pytest.raises(ValueError):
+            PositionCleaner().clean(pd.concat([later, positions],
+                                              ignore_index=True))
+        # positions sorted by vehicle
+        with pytest.raises(ValueError):
+            PositionCleaner().clean(positions.sort_values('VehicleNumber'))
+
+    def test_store(self, tmpdir):
+        positions = self.get_positions()
+        positions.loc[62, 'Lon'] = 21.1
+        positions['Time'] = pd.to_datetime(positions['Time'])
+        TrajectoryStore.from_frame(positions).save(tmpdir / 'store')
+
+        cleaner = PositionCleaner()
+        data = Calculator.read_positions(tmpdir / 'store', cleaner=cleaner)
+        assert cleaner.removed == {'stale': 0, 'future': 0, 'bounds': 0,
+                                   'teleport': 1}
+        assert len(data) == len(positions) - 1
+
+    def test_speed_calculator(self, tmpdir):
+        positions = self.get_positions()
+        positions.loc[62, 'Lon'] = 21.1
+        positions.to_csv(tmpdir / 'positions.csv')
+
+        calculator = SpeedCalculator(
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 17:00:00'),
+            cache=PartitionCache(tmpdir / 'cache'),
+            cleaner=PositionCleaner(),
+        )
+        calculator.calculate()
+        assert len(calculator.data) == len(positions) - 1
+        assert calculator.data['Speed'].max() < 50
+
+
+class TestPartitionCache:
+    WINDOWS = [('16:00', '18:00'), ('16:00', '19:00'), ('17:00', '20:00'),
+               ('16:30', '17:15')]
+
+    def write_data(self, tmpdir):
+        schedules = []
+        positions = []
+
+        for line in range(100, 103):
+            for i in range(0, 240, 2):
+                time = dateutil.parser.parse('2021-02-02 16:00:00') + \
+                    datetime.timedelta(minutes=i, seconds=line)
+                positions.append({
+                    'Lines': str(line),
+                    'Lat': round(52.2 + 0.0005 * (i % 20), 6),
+                    'Lon': 21.0,
+                    'VehicleNumber': str(line),
+                    'Time': time,
+                    'Brigade': '1',
+                })
+                schedules.append({
+                    'Lines': str(line),
+                    'Lat': 52.2,
+                    'Lon': 21.0,
+                    'Brigade': '1',
+                    'BusStopName': 'Banacha',
+                    'Time': f'{16 + i // 60}:{i % 60:02d}:00',
+                })
+
+        pd.DataFrame(schedules).to_csv(tmpdir / 'schedules.csv')
+        pd.DataFrame(positions).to_csv(tmpdir / 'positions.csv')
+
+    @staticmethod
+    def window(start, end):
+        return {
+            'start': dateutil.parser.parse(f'2021-02-02 {start}'),
+            'end': dateutil.parser.parse(f'2021-02-02 {end}'),
+        }
+
+    def test_speed_calculator(self, tmpdir):
+        self.write_data(tmpdir)
+        cache = PartitionCache(tmpdir / 'cache')
+
+        calculated = []
+        for start, end in self.WINDOWS:
+            kwargs = {'positions_filename': tmpdir / 'positions.csv',
+                      **self.window(start, end)}
+            expected = SpeedCalculator(**kwargs)
+            expected.calculate()
+
+            calculator = SpeedCalculator(cache=cache, **kwargs)
+            with unittest.mock.patch.object(
+                    calculator, '_calculate_partitions',
+                    wraps=calculator._calculate_partitions) as mock:
+                calculator.calculate()
+            calculated.append(mock.call_args[0][0] if mock.called else [])
+
+            assert expected.data['Speed'].notna().any()
+            assert (calculator.data.fillna(0) ==
+                    expected.data.fillna(0)).all(axis=None)
+
+        assert [len(partitions) for partitions in calculated] == [3, 1, 1, 0]
+
+    def test_delay_calculator(self, tmpdir):
+        self.write_data(tmpdir)
+        cache = PartitionCache(tmpdir / 'cache')
+
+        for start, end in self.WINDOWS:
+            kwargs = {'schedules_filename': tmpdir / 'schedules.csv',
+                      'positions_filename': tmpdir / 'positions.csv',
+                      **self.window(start, end)}
+            expected = DelayCalculator(**kwargs)
+            expected.calculate()
+
+            calculator = DelayCalculator(cache=cache, **kwargs)
+            calculator.calculate()
+
+            assert expected.data['Delay'].notna().any()
+            assert (calculator.data.fillna(-1) ==
+                    expected.data.fillna(-1)).all(axis=None)
+
+    def test_corrupt_entry(self, tmpdir):
+        cache = PartitionCache(tmpdir / 'cache')
+        partition = dateutil.parser.parse('2021-02-02 16:00')
+        cache.put('foo', partition, pd.DataFrame({'a': [1]}))
+        with open(cache._path('foo', partition), 'wb') as file:
+            file.write(b'corrupt')
+
+        assert cache.get('foo', partition) is None
+
+
+class TestApproximateMode:
+    def get_calculator(self, tmpdir):
+        schedules = []
+        positions = []
+
+        for line in range(100, 110):
+            for i in range(20):
+                schedules.append({
+                    'Lines': str(line),
+                    'Lat': 0,
+                    'Lon': 0,
+                    'Brigade': str(i),
+                    'BusStopName': 'Banacha',
+                    'Time': '16:00:00',
+                })
+                positions.append({
+                    'Lines': str(line),
+                    'Lat': 0,
+                    'Lon': 0,
+                    'VehicleNumber': f'{line}_{i}',
+                    'Time': f'2021-02-02 16:{(i + line) % 20:02d}:00',
+                    'Brigade': str(i),
+                })
+
+        pd.DataFrame(schedules).to_csv(tmpdir / 'schedules.csv')
+        pd.DataFrame(positions).to_csv(tmpdir / 'positions.csv')
+
+        return DelayCalculator(
+            schedules_filename=tmpdir / 'schedules.csv',
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 17:00:00'),
+        )
+
+    def test_exact(self, tmpdir):
+        calculator = self.get_calculator(tmpdir)
+        calculator.calculate()
+
+        estimate = calculator.estimate('Delay')
+        assert estimate.loc['mean'].tolist() == [9.5, 9.5, 9.5]
+        assert estimate.loc['total'].tolist() == [1900, 1900, 1900]
+
+    def test_sample(self, tmpdir):
+        calculator = self.get_calculator(tmpdir)
+        sampled = calculator.sample(fraction=0.25, seed=0)
+        calculator.calculate()
+
+        assert len(sampled) == 50
+        assert len(calculator.data) == 50
+        assert (calculator.sampled == 5).all()
+
+        estimate = calculator.estimate('Delay')
+        assert estimate.loc['mean', 'low'] < 9.5 < \
+            estimate.loc['mean', 'high']
+        assert estimate.loc['total', 'low'] < 1900 < \
+            estimate.loc['total', 'high']
+        assert estimate.loc['mean', 'high'] - estimate.loc['mean', 'low'] < 5
+
+    def test_sample_fraction(self, tmpdir):
+        calculator = self.get_calculator(tmpdir)
+
+        for fraction in [0, -0.5, 1.5]:
+            with pytest.raises(ValueError):
+                calculator.sample(fraction=fraction)
+
+    def test_speed_exact(self, tmpdir):
+        TestTrajectoryStore.get_positions().to_csv(tmpdir / 'positions.csv')
+        calculator = SpeedCalculator(
+            positions_filename=tmpdir / 'positions.csv',
+            start=dateutil.parser.parse('2021-02-02 16:00:00'),
+            end=dateutil.parser.parse('2021-02-02 16:30:00'),
+        )
+        calculator.calculate()
+
+        estimate = calculator.estimate('Speed')
+        assert np.isclose(estimate.loc['mean', 'estimate'],
+                          calculator.data['Speed'].mean())
+        assert np.isclose(estimate.loc['total', 'high'],
+                          calculator.data['Speed'].sum())
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+from .calculator import Calculator
+
+
+class TrajectorySimplifier:
+    """Class for removing redundant positions from vehicle tracks.
+
+    First, repeated positions of stationary vehicles are dropped, keeping
+    the first and the last position of each stop. Then each track is
+    simplified with Douglas-Peucker algorithm, run for all the tracks at once.
+    Positions are never dropped, if that would leave a gap longer than
+    `max_gap` or shorten the track by more than `length_tolerance`, so
+    distances and speeds stay within bounds. With a stop index, positions in
+    radius of stops are never simplified either, only repeated ones inside
+    the radius are dropped, so arrivals are found in simplified tracks with
+    the same times of entering and leaving the radius.
+    """
+
+    # number of times tolerance is halved for tracks shortened too much
+    RETRIES = 4
+
+    def __init__(self, tolerance=0.01, stationary_tolerance=0.005,
+                 length_tolerance=0.01, max_gap=60, stop_index=None):
+        """Initialize TrajectorySimplifier.
+
+        Parameters
+        ----------
+        tolerance : float
+            Maximum km distance of a dropped position from the simplified track.
+        stationary_tolerance : float
+            Maximum km distance between positions of a stationary vehicle.
+        length_tolerance : float
+            Maximum relative loss of a track length by simplification.
+        max_gap : float
+            Maximum seconds between kept positions of a moving vehicle, as long
+            as there are positions to keep in between.
+        stop_index : StopIndex, optional
+            Index of stops with the radius of arrivals, i.e.
+            `ArrivalCalculator.DISTANCE_THRESHOLD`. Without it, arrivals may
+            be missed or found late in simplified tracks.
+        """
+
+        self.tolerance = tolerance
+        self.stationary_tolerance = stationary_tolerance
+        self.length_tolerance = length_tolerance
+        self.max_gap = max_gap
+        self.stop_index = stop_index
+        # number of positions dropped by each stage of the latest run
+        self.removed = {}
+
+    def simplify(self, data):
+        """Get positions left after simplification.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Positions of any number of vehicles.
+
+        Returns
+        -------
+        DataFrame
+            Subset of rows of data, in the original order.
+        """
+
+        ordered = data.assign(Time=pd.to_datetime(data['Time'])) \
+            .sort_values(['VehicleNumber', 'Time'])
+        vehicle = ordered['VehicleNumber'].values
+        y = ordered['Lat'].values * Calculator.DEGREE
+        x = ordered['Lon'].values * Calculator.DEGREE * \
+            np.cos(np.radians(ordered['Lat'].values))
+        time = ordered['Time'].values.astype('datetime64[s]').astype(np.int64)
+
+        # positions starting and ending each track
+        first = np.ones(len(ordered), dtype=bool)
+        first[1:] = vehicle[1:] != vehicle[:-1]
+        last = np.roll(first, -1)
+        fixed = first | last
+
+        moving = self._moving(x, y, first, last)
+
+        if self.stop_index is not None:
+            ids, _ = self.stop_index.lookup(ordered['Lat'].values,
+                                            ordered['Lon'].values)
+            inside = ids != None  # noqa: E711
+            # entries into and exits from radius of stops are never dropped
+            moving |= inside & (first | last |
+                                np.append(False, ~inside[:-1]) |
+                                np.append(~inside[1:], False))
+            fixed |= inside & moving
+        self.removed = {'stationary': int((~moving).sum())}
+
+        # ends of each stop, so the time spent at it is kept
+        fixed |= moving & (np.append(~moving[1:], False) |
+                           np.append(False, ~moving[:-1]))
+
+        keep = self._simplify_moving(x, y, fixed, moving, self.tolerance)
+
+        # retry tracks shortened too much with lower tolerance, tracks still
+        # shortened too much are left with all moving positions
+        length = self._lengths(x, y, moving, vehicle)
+        tolerance = self.tolerance
+        for retry in range(self.RETRIES + 1):
+            short = self._lengths(x, y, keep, vehicle) < \
+                (1 - self.length_tolerance) * length
+            if not short.any():
+                break
+            if retry == self.RETRIES:
+                keep = np.where(short, moving, keep)
+                break
+            tolerance /= 2
+            keep = np.where(short, self._simplify_moving(x, y, fixed, moving,
+                                                         tolerance), keep)
+
+        if self.max_gap:
+            keep = self._bound_gaps(time, keep, moving)
+
+        self.removed['douglas_peucker'] = int((moving & ~keep).sum())
+        return data.loc[ordered.index[keep]].sort_index()
+
+    def _bound_gaps(self, time, keep, moving):
+        """Keep moving positions, until no gap is longer than `max_gap`.
+
+        Each pass keeps, in each gap too long, the last position not later
+        than `max_gap` after its start, or the first one, if there is none.
+        """
+
+        keep = keep.copy()
+        index = np.arange(len(time))
+
+        while True:
+            kept = np.flatnonzero(keep)
+            # gap containing each position, between kept ones
+            gap = np.searchsorted(kept, index, 'right') - 1
+            start = kept[gap]
+            end = kept[np.minimum(gap + 1, len(kept) - 1)]
+
+            candidates = ~keep & moving & (time[end] - time[start] >
+                                           self.max_gap)
+            if not candidates.any():
+                return keep
+
+            gaps = pd.Series(index[candidates]).groupby(gap[candidates])
+            within = candidates & (time - time[start] <= self.max_gap)
+            added = gaps.min()
+            added.update(pd.Series(index[within]).groupby(gap[within]).max())
+            keep[added.values] = True
+
+    def _simplify_moving(self, x, y, fixed, moving, tolerance):
+        """Get mask of positions kept by Douglas-Peucker among moving ones."""
+
+        index = np.flatnonzero(moving)
+        keep = np.zeros(len(x), dtype=bool)
+        keep[index] = self._douglas_peucker(x[index], y[index], fixed[index],
+                                            tolerance)
+        return keep
+
+    def _moving(self, x, y, first, last):
+        """Get mask of positions other than repeated ones of stationary vehicles.
+
+        Position is repeated, when it's close to both previous and next one.
+        """
+
+        step = np.hypot(np.diff(x), np.diff(y)) < self.stationary_tolerance
+        close_previous = np.append(False, step) & ~first
+        close_next = np.append(step, False) & ~last
+        return ~(close_previous & close_next)
+
+    @staticmethod
+    def _douglas_peucker(x, y, fixed, tolerance):
+        """Simplify all the tracks at once.
+
+        Fixed positions, which have to include the ends of each track,
+        are always kept. Each iteration splits every segment of the simplified
+        tracks at its farthest position, if that is beyond tolerance.
+
+        Returns
+        -------
+        ndarray
+            Mask of kept positions.
+        """
+
+        keep = fixed.copy()
+        candidates = np.arange(len(x))
+
+        while True:
+            kept = np.flatnonzero(keep)
+            # segment of simplified track containing each position
+            segment = np.searchsorted(kept, candidates, 'right') - 1
+            start = kept[segment]
+            end = kept[np.minimum(segment + 1, len(kept) - 1)]
+
+            distance = TrajectorySimplifier._segment_distances(
+                x, y, candidates, start, end
+            )
+            distance[keep[candidates]] = -1
+
+            # the farthest position of each segment
+            farthest = pd.Series(distance).groupby(segment).idxmax().values
+            farthest = farthest[distance[farthest] > tolerance]
+            if not len(farthest):
+                return keep
+            keep[candidates[farthest]] = True
+
+    @staticmethod
+    def _segment_distances(x, y, points, start, end):
+        """Get distances of points from segments between start and end."""
+
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[points] - x[start], y[points] - y[start]
+        squared = dx ** 2 + dy ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.clip((px * dx + py * dy) / squared, 0, 1)
+        t = np.where(squared > 0, t, 0)
+        return np.hypot(px - t * dx, py - t * dy)
+
+    @staticmethod
+    def _lengths(x, y, keep, vehicle):
+        """Get length of each track made of kept positions, by position."""
+
+        index = np.flatnonzero(keep)
+        step = np.hypot(np.diff(x[index]), np.diff(y[index]))
+        step = np.append(0, step)
+        # steps between different vehicles do not count
+        step[np.append(True, vehicle[index][1:] != vehicle[index][:-1])] = 0
+
+        lengths = pd.Series(step).groupby(vehicle[index]).sum()
+        return lengths.reindex(vehicle).values
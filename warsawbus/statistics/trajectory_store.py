@@ -0,0 +1,339 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class TrajectoryStore:
+    """Class for storing positions as contiguous tracks of each vehicle.
+
+    Positions are ordered by vehicle and time, so tracks of vehicles, lines
+    and brigades are slices of the arrays. Time and coordinates are delta
+    encoded, with absolute values kept every `BLOCK_SIZE` points, so any
+    slice is decoded without touching the rest of the store. Time range of
+    a slice is found in each track by its absolute time values, so only the
+    blocks overlapping it are decoded. Other columns of positions, i.e.
+    `StopId` of tagged positions, are stored as they are. Stores are saved
+    as a directory of .npy files and can be read memory-mapped.
+    """
+
+    # coordinates are kept as integer micro degrees (~0.1 m)
+    COORD_SCALE = 10 ** 6
+    # number of points between absolute values
+    BLOCK_SIZE = 256
+    ARRAYS = [
+        'time_delta', 'lat_delta', 'lon_delta',
+        'time_anchor', 'lat_anchor', 'lon_anchor',
+        'vehicles', 'vehicle_offsets',
+        'run_lines', 'run_brigades', 'run_offsets',
+        # runs of missing lines and brigades
+        'run_lines_missing', 'run_brigades_missing',
+    ]
+    COLUMNS = ['Lines', 'Lat', 'Lon', 'Time', 'Brigade', 'VehicleNumber']
+    # columns, which positions cannot be stored without
+    REQUIRED = ['Lat', 'Lon', 'Time', 'VehicleNumber']
+
+    def __init__(self, arrays, columns=None):
+        """Initialize TrajectoryStore.
+
+        Parameters
+        ----------
+        arrays : dict
+            Arrays of the store by name, see `ARRAYS`.
+        columns : dict, optional
+            Values of other columns by name, ordered as positions are, along
+            with the mask of missing values of string columns or None.
+        """
+
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.columns = columns or {}
+
+    def __len__(self):
+        return len(self.time_delta)
+
+    @classmethod
+    def from_frame(cls, data):
+        """Create a store from positions data.
+
+        Raises
+        ------
+        ValueError
+            If any position misses coordinates, time or vehicle, or other
+            column has values other than numbers, times and strings.
+        """
+
+        missing = data[cls.REQUIRED].isna().any()
+        if missing.any():
+            raise ValueError(f'Positions with missing '
+                             f'{", ".join(missing.index[missing])} cannot '
+                             f'be stored')
+
+        data = data.sort_values(['VehicleNumber', 'Time'])
+        vehicle = data['VehicleNumber'].values.astype(str)
+        line, line_missing = cls._encode_strings(data['Lines'].values)
+        brigade, brigade_missing = cls._encode_strings(data['Brigade'].values)
+        arrays = {}
+
+        time = pd.to_datetime(data['Time']).values.astype('datetime64[s]') \
+            .astype(np.int64)
+        lat = np.round(data['Lat'].values * cls.COORD_SCALE).astype(np.int64)
+        lon = np.round(data['Lon'].values * cls.COORD_SCALE).astype(np.int64)
+        for name, values, dtype in [('time', time, np.int64),
+                                    ('lat', lat, np.int32),
+                                    ('lon', lon, np.int32)]:
+            delta = np.diff(values, prepend=values[:1])
+            delta[::cls.BLOCK_SIZE] = 0
+            arrays[f'{name}_delta'] = delta.astype(np.int32)
+            arrays[f'{name}_anchor'] = values[::cls.BLOCK_SIZE].astype(dtype)
+
+        # vehicle tracks
+        starts = cls._run_starts(vehicle)
+        arrays['vehicles'] = vehicle[starts]
+        arrays['vehicle_offsets'] = np.append(starts, len(data))
+
+        # runs of the same line and brigade within a vehicle track
+        starts = cls._run_starts(vehicle, line, brigade, line_missing,
+                                 brigade_missing)
+        arrays['run_lines'] = line[starts]
+        arrays['run_brigades'] = brigade[starts]
+        arrays['run_lines_missing'] = line_missing[starts]
+        arrays['run_brigades_missing'] = brigade_missing[starts]
+        arrays['run_offsets'] = np.append(starts, len(data))
+
+        columns = {}
+        for name in data.columns:
+            if name in cls.COLUMNS:
+                continue
+            values = data[name].to_numpy()
+            # numbers, booleans, times and timedeltas
+            if values.dtype.kind in 'biufmM':
+                columns[name] = (values, None)
+            elif all(isinstance(value, str)
+                     for value in values[~pd.isna(values)]):
+                columns[name] = cls._encode_strings(values)
+            else:
+                raise ValueError(f'Column {name} cannot be stored')
+
+        return cls(arrays, columns)
+
+    @staticmethod
+    def _encode_strings(values):
+        """Get strings of values, with missing ones empty, and their mask."""
+
+        missing = pd.isna(values)
+        return np.where(missing, '', values).astype(str), missing
+
+    @staticmethod
+    def _decode_strings(values, missing):
+        """Get strings of values, with missing ones None."""
+
+        values = np.asarray(values).astype(object)
+        values[np.asarray(missing)] = None
+        return values
+
+    @staticmethod
+    def _run_starts(*keys):
+        """Get indices, where any of the keys changes."""
+
+        change = np.zeros(len(keys[0]), dtype=bool)
+        change[:1] = True
+        for key in keys:
+            change[1:] |= key[1:] != key[:-1]
+        return np.flatnonzero(change)
+
+    @staticmethod
+    def is_store(path):
+        return os.path.isdir(path)
+
+    def save(self, dirname):
+        os.makedirs(dirname, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(dirname, f'{name}.npy'), getattr(self, name))
+
+        # other columns are saved by their number, since names may not be
+        # valid filenames
+        np.save(os.path.join(dirname, 'columns.npy'),
+                np.array(list(self.columns), dtype=str))
+        for i, (values, missing) in enumerate(self.columns.values()):
+            np.save(os.path.join(dirname, f'column_{i}.npy'), values)
+            if missing is not None:
+                np.save(os.path.join(dirname, f'column_{i}_missing.npy'),
+                        missing)
+
+    @classmethod
+    def load(cls, dirname, mmap=True):
+        """Load a store.
+
+        Parameters
+        ----------
+        dirname : str
+        mmap : bool
+            Whether to memory-map arrays instead of reading them.
+        """
+
+        mode = 'r' if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(dirname, f'{name}.npy'),
+                           mmap_mode=mode)
+
+        columns = {}
+        for i, name in enumerate(load('columns')):
+            # only string columns have a mask of missing values
+            strings = os.path.exists(os.path.join(dirname,
+                                                  f'column_{i}_missing.npy'))
+            columns[str(name)] = (load(f'column_{i}'),
+                                  load(f'column_{i}_missing') if strings
+                                  else None)
+        return cls({name: load(name) for name in cls.ARRAYS}, columns)
+
+    def slice(self, vehicle=None, line=None, brigade=None, start=None,
+              end=None):
+        """Get positions ordered by vehicle and time.
+
+        Parameters
+        ----------
+        vehicle : str, optional
+        line : str, optional
+        brigade : str, optional
+            Considered only along with line.
+        start : datetime, optional
+        end : datetime, optional
+            Time range is inclusive on both ends.
+        """
+
+        if vehicle is not None:
+            i = np.searchsorted(self.vehicles, vehicle)
+            found = i < len(self.vehicles) and self.vehicles[i] == vehicle
+            ranges = [(self.vehicle_offsets[i], self.vehicle_offsets[i + 1])] \
+                if found else []
+        elif line is None:
+            # every track separately, so each can be narrowed to time range
+            offsets = np.asarray(self.vehicle_offsets)
+            ranges = list(zip(offsets[:-1], offsets[1:]))
+
+        if line is not None:
+            runs = (self.run_lines == line) & ~self.run_lines_missing
+            if brigade is not None:
+                runs &= (self.run_brigades == brigade) & \
+                ~self.run_brigades_missing
+            runs = [(self.run_offsets[i], self.run_offsets[i + 1])
+                    for i in np.flatnonzero(runs)]
+            # runs lie within single tracks themselves
+            ranges = runs if vehicle is None else \
+                [(max(a, c), min(b, d)) for a, b in ranges
+                 for c, d in runs if max(a, c) < min(b, d)]
+
+        # ranges lie within single tracks, ordered by vehicle and time
+        starts = np.array([i for i, _ in ranges], dtype=np.int64)
+        ends = np.array([j for _, j in ranges], dtype=np.int64)
+        if start is not None:
+            starts = self._narrow(starts, ends, self._seconds(start), 'start')
+        if end is not None:
+            ends = self._narrow(starts, ends, self._seconds(end), 'end')
+
+        data = self._frame(self._indices(starts, ends))
+        if start is not None:
+            data = data[data['Time'] >= start]
+        if end is not None:
+            data = data[data['Time'] <= end]
+        return data.reset_index(drop=True)
+
+    def _narrow(self, starts, ends, seconds, side):
+        """Narrow ranges of tracks down to blocks overlapping time range.
+
+        Blocks of each range are binary searched by their absolute time all
+        at once, considering only blocks, which lie inside the range.
+
+        Parameters
+        ----------
+        starts : ndarray
+        ends : ndarray
+        seconds : int
+            Start or end of time range.
+        side : str
+            'start' to narrow the starts of ranges, 'end' to narrow the ends.
+
+        Returns
+        -------
+        ndarray
+            Narrowed starts or ends of ranges.
+        """
+
+        first = -(-starts // self.BLOCK_SIZE)
+        last = np.maximum((ends - 1) // self.BLOCK_SIZE + 1, first)
+
+        # number of blocks of each range with time before the time range,
+        # or not after its end
+        low, high = first.copy(), last.copy()
+        while (low < high).any():
+            searched = low < high
+            middle = (low + high) // 2
+            anchor = np.asarray(self.time_anchor[middle[searched]])
+            before = np.zeros(len(low), dtype=bool)
+            before[searched] = anchor < seconds if side == 'start' else \
+                anchor <= seconds
+            low = np.where(searched & before, middle + 1, low)
+            high = np.where(searched & ~before, middle, high)
+
+        if side == 'start':
+            return np.maximum(starts, (low - 1) * self.BLOCK_SIZE)
+        return np.maximum(np.minimum(ends, low * self.BLOCK_SIZE), starts)
+
+    @staticmethod
+    def _indices(starts, ends):
+        """Get indices of all the positions of ranges."""
+
+        counts = ends - starts
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    def _frame(self, index):
+        """Decode positions of given indices."""
+
+        blocks = np.unique(index // self.BLOCK_SIZE)
+        time = self._decode(self.time_anchor, self.time_delta, blocks, index)
+        lat = self._decode(self.lat_anchor, self.lat_delta, blocks, index)
+        lon = self._decode(self.lon_anchor, self.lon_delta, blocks, index)
+
+        runs = np.searchsorted(self.run_offsets, index, 'right') - 1
+        vehicles = np.searchsorted(self.vehicle_offsets, index, 'right') - 1
+
+        data = pd.DataFrame({
+            'Lines': self._decode_strings(self.run_lines[runs],
+                                          self.run_lines_missing[runs]),
+            'Lat': lat / self.COORD_SCALE,
+            'Lon': lon / self.COORD_SCALE,
+            'Time': time.astype('datetime64[s]').astype('datetime64[ns]'),
+            'Brigade': self._decode_strings(self.run_brigades[runs],
+                                            self.run_brigades_missing[runs]),
+            'VehicleNumber': np.asarray(self.vehicles)[vehicles].astype(object),
+        })
+        for name, (values, missing) in self.columns.items():
+            data[name] = np.asarray(values[index]) if missing is None else \
+                self._decode_strings(values[index], missing[index])
+        return data
+
+    def _decode(self, anchor, delta, blocks, index):
+        """Decode absolute values of indices from anchors and deltas of blocks.
+
+        Only the given blocks, which have to contain the indices, are read.
+        """
+
+        points = (blocks[:, np.newaxis] * self.BLOCK_SIZE +
+                  np.arange(self.BLOCK_SIZE)).ravel()
+        points = points[points < len(delta)]
+
+        # deltas of the first point of each block are 0
+        total = np.cumsum(np.asarray(delta[points]), dtype=np.int64)
+        block = points // self.BLOCK_SIZE
+        block_start = np.searchsorted(points, block * self.BLOCK_SIZE)
+        values = np.asarray(anchor[block]).astype(np.int64) + total - \
+            total[block_start]
+        return values[np.searchsorted(points, index)]
+
+    @staticmethod
+    def _seconds(date):
+        return pd.Timestamp(date).to_datetime64().astype('datetime64[s]') \
+            .astype(np.int64)
@@ -1,6 +1,10 @@
+from .cache import PlotDataCache
+from .live_plotter import LivePlotter
 from .plotter import WarsawPlotter
 
 
 __all__ = [
+    'LivePlotter',
+    'PlotDataCache',
     'WarsawPlotter',
 ]
@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+from ..statistics.disk_cache import DiskCache
+
+
+class PlotDataCache(DiskCache):
+    """Disk cache of data prepared for plotting.
+
+    Entries are keyed by the content hash of the input file together with
+    the column of interest and its bounds, so renders which only differ in
+    title, marker size or colorscale reuse the same prepared data. When total
+    size of the cache exceeds `max_size`, least recently used entries are
+    evicted.
+    """
+
+    # bump when the way data is prepared for plotting changes
+    VERSION = 1
+
+    def __init__(self, dirname, max_size=64 * 1024 * 1024):
+        """Initialize PlotDataCache.
+
+        Parameters
+        ----------
+        dirname : str
+            Path to a cache directory. It will be created if needed.
+        max_size : int
+            Maximum total size of cached entries in bytes.
+        """
+
+        super().__init__(dirname)
+        self.max_size = max_size
+
+    def key(self, filename, column_name, bounds):
+        """Get cache key of data prepared from given file and parameters."""
+
+        digest = hashlib.sha256()
+        self._hash_file(digest, filename)
+        digest.update(f'|{self.VERSION}|{column_name}|{bounds}'.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Get cached data or None, if there is no such entry."""
+
+        path = self._path(key)
+        data = self._read(path)
+        if data is None:
+            return None
+
+        # mark entry as recently used
+        os.utime(path)
+        return data
+
+    def put(self, key, data):
+        """Store data in cache and evict old entries if needed."""
+
+        self._write(self._path(key), data)
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.dirname, f'{key}.pkl')
+
+    def _evict(self):
+        """Remove least recently used entries exceeding maximum size."""
+
+        entries = []
+        for name in os.listdir(self.dirname):
+            if not name.endswith('.pkl'):
+                continue
+            stat = os.stat(os.path.join(self.dirname, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            os.remove(os.path.join(self.dirname, name))
+            total -= size
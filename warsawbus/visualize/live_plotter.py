@@ -0,0 +1,231 @@
+import json
+import os
+import re
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from .plotter import WarsawPlotter
+
+
+class LivePlotter(WarsawPlotter):
+    """Class for visualizing live data on Warsaw map.
+
+    Static HTML page is written once. Each update publishes only values
+    changed since the previous one as a small JSON delta, which the page
+    fetches and applies to the map. Full snapshot is published every few
+    updates, so newly opened pages and pages left behind can catch up.
+    Sequence of updates continues from the ones left in the directory by
+    a previous run, so pages open through a restart catch up as well.
+    """
+
+    SNAPSHOT_FILENAME = 'snapshot.json'
+    DELTA_FILENAME = 'delta_{:08d}.json'
+    DELTA_PATTERN = re.compile(r'delta_(\d{8})\.json')
+
+    # decimal places of published coordinates (~0.1 m) and values
+    COORD_DECIMALS = 6
+    VALUE_DECIMALS = 2
+
+    # applies published updates to the map, SNAPSHOT_FILENAME and INTERVAL
+    # are filled in when writing the page
+    SCRIPT = '''
+var plot = document.getElementById('{plot_id}');
+var state = {};
+var next = null;
+
+function load(filename) {
+    return fetch(filename, {cache: 'no-store'})
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .catch(function () { return null; });
+}
+
+function render() {
+    var keys = Object.keys(state);
+    var column = function (i) { return keys.map(function (k) { return state[k][i]; }); };
+    Plotly.restyle(plot, {
+        lat: [column(0)], lon: [column(1)], text: [column(2)], 'marker.color': [column(2)]
+    }, [0]);
+}
+
+function reset() {
+    return load('SNAPSHOT_FILENAME').then(function (snapshot) {
+        if (snapshot && (next === null || snapshot.sequence >= next)) {
+            state = snapshot.state;
+            next = snapshot.sequence + 1;
+            render();
+        }
+        return false;
+    });
+}
+
+function update() {
+    if (next === null) {
+        return reset();
+    }
+    var filename = 'delta_' + String(next).padStart(8, '0') + '.json';
+    return load(filename).then(function (delta) {
+        // delta is not published yet or was already removed
+        if (!delta) {
+            return reset();
+        }
+        Object.assign(state, delta.changed);
+        delta.removed.forEach(function (key) { delete state[key]; });
+        next = delta.sequence + 1;
+        render();
+        return true;
+    });
+}
+
+function poll() {
+    update().then(function (applied) {
+        // catch up with the following deltas right away
+        setTimeout(poll, applied ? 0 : INTERVAL);
+    });
+}
+
+poll();
+'''
+
+    def __init__(self, dirname, column_name, key='VehicleNumber',
+                 snapshot_every=20, interval=15):
+        """Initialize LivePlotter.
+
+        Parameters
+        ----------
+        dirname : str
+            Directory of the page and published updates, to be served over HTTP.
+        column_name : str
+            Name of column of interest, so column, which values will be plotted on map.
+        key : str
+            Name of column identifying each point, i.e. a vehicle.
+        snapshot_every : int
+            Number of updates between full snapshots. Twice as many deltas are kept.
+        interval : float
+            Seconds between checks for a new update by the page.
+        """
+
+        self.dirname = dirname
+        self.column_name = column_name
+        self.key = key
+        self.snapshot_every = snapshot_every
+        self.interval = interval
+
+        self.data = pd.DataFrame(columns=['Lat', 'Lon', column_name])
+        # published values by key
+        self.state = {}
+        os.makedirs(dirname, exist_ok=True)
+        self.sequence = self._last_sequence()
+        # sequence of the latest snapshot of this run
+        self.snapshot_sequence = None
+
+    def write_page(self, filename, title, size, opacity, colorscale):
+        """Write the page, which plots published updates.
+
+        Parameters
+        ----------
+        filename : str
+            Page filename inside the directory, i.e. 'index.html'.
+        title : str
+        size : float
+            Size of markers of each point.
+        opacity : float
+            Opacity of markers of each point.
+        colorscale : str
+        """
+
+        scatter_map = self._prepare_map(size, opacity, colorscale)
+        layout = self._prepare_layout(title)
+        figure = go.Figure(data=[scatter_map], layout=layout)
+
+        script = self.SCRIPT \
+            .replace('SNAPSHOT_FILENAME', self.SNAPSHOT_FILENAME) \
+            .replace('INTERVAL', str(int(self.interval * 1000)))
+        figure.write_html(os.path.join(self.dirname, filename),
+                          include_plotlyjs='cdn', post_script=script)
+
+    def publish(self, data):
+        """Publish changes of data since the previous update.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Current data with key, `Lat`, `Lon` and column of interest.
+
+        Returns
+        -------
+        dict
+            Published delta.
+        """
+
+        current = self._values(data)
+        changed = {key: value for key, value in current.items()
+                   if self.state.get(key) != value}
+        removed = [key for key in self.state if key not in current]
+
+        self.sequence += 1
+        self.state = current
+        delta = {'sequence': self.sequence, 'changed': changed,
+                 'removed': removed}
+
+        first = self.snapshot_sequence is None
+        # the first update is published only as a snapshot, since pages
+        # may still hold the state of a previous run
+        if not first:
+            self._write(self.DELTA_FILENAME.format(self.sequence), delta)
+
+        if first or \
+                self.sequence - self.snapshot_sequence >= self.snapshot_every:
+            self._write(self.SNAPSHOT_FILENAME,
+                        {'sequence': self.sequence, 'state': self.state})
+            self.snapshot_sequence = self.sequence
+
+        if first:
+            # deltas left by a previous run
+            for name in os.listdir(self.dirname):
+                if self.DELTA_PATTERN.fullmatch(name):
+                    os.remove(os.path.join(self.dirname, name))
+
+        # remove deltas, which are older than the previous snapshot
+        outdated = self.sequence - 2 * self.snapshot_every
+        if outdated > 0:
+            path = os.path.join(self.dirname,
+                                self.DELTA_FILENAME.format(outdated))
+            if os.path.exists(path):
+                os.remove(path)
+
+        return delta
+
+    def _last_sequence(self):
+        """Get the latest sequence published in the directory, or 0."""
+
+        sequences = [int(match.group(1)) for match in map(
+            self.DELTA_PATTERN.fullmatch, os.listdir(self.dirname)
+        ) if match]
+        path = os.path.join(self.dirname, self.SNAPSHOT_FILENAME)
+        if os.path.exists(path):
+            with open(path) as file:
+                sequences.append(json.load(file)['sequence'])
+        return max(sequences, default=0)
+
+    def _values(self, data):
+        """Get rounded values of each point by its key."""
+
+        data = data.dropna(subset=['Lat', 'Lon'])
+        keys = data[self.key].astype(str)
+        lat = data['Lat'].round(self.COORD_DECIMALS)
+        lon = data['Lon'].round(self.COORD_DECIMALS)
+        values = data[self.column_name].round(self.VALUE_DECIMALS)
+
+        # missing values are published as nulls
+        return {key: [float(la), float(lo), None if pd.isna(value) else
+                      float(value)]
+                for key, la, lo, value in zip(keys, lat, lon, values)}
+
+    def _write(self, filename, content):
+        """Write JSON file, so no partial file is ever read by the page."""
+
+        path = os.path.join(self.dirname, filename)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(content, file, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
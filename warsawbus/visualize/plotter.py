@@ -22,7 +22,7 @@ class WarsawPlotter:
         'Speed': float,
     }
 
-    def __init__(self, filename, column_name, bounds):
+    def __init__(self, filename, column_name, bounds, cache=None):
         """Initialize WarsawPlotter.
 
         Parameters
@@ -33,13 +33,23 @@ class WarsawPlotter:
             Name of column of interest, so column, which values will be plotted on map.
         bounds : tuple
             Minimum and maximum value for column of interest, resulting in a clear, human-readable plot.
+        cache : PlotDataCache, optional
+            Cache of prepared data. On hit, reading and parsing of the file is skipped.
         """
 
-        self.data = pd.read_csv(filename, index_col=0, dtype=self.POSSIBLE_DTYPES)
         self.column_name = column_name
 
+        key = cache.key(filename, column_name, bounds) if cache else None
+        self.data = cache.get(key) if cache else None
+        if self.data is not None:
+            return
+
+        self.data = pd.read_csv(filename, index_col=0, dtype=self.POSSIBLE_DTYPES)
         self._prepare_data(bounds)
 
+        if cache:
+            cache.put(key, self.data)
+
     def _prepare_data(self, bounds):
         """Parse data."""
 
@@ -47,7 +57,8 @@ class WarsawPlotter:
         self.data.dropna(inplace=True)
         self.data = self.data[self.data[self.column_name].between(*bounds)]
         # remove coordinate duplicates
-        self.data = self.data.groupby(['Lat', 'Lon']).mean().reset_index()
+        self.data = self.data.groupby(['Lat', 'Lon']).mean(numeric_only=True)\
+            .reset_index()
 
     def plot(self, filename, title, size, opacity, colorscale):
         """Create plot.
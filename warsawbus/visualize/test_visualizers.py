@@ -0,0 +1,145 @@
+import json
+import os
+import unittest.mock
+
+import pandas as pd
+
+from .cache import PlotDataCache
+from .live_plotter import LivePlotter
+from .plotter import WarsawPlotter
+
+
+class TestPlotDataCache:
+    DATA = pd.DataFrame([{
+        'Lines': '523',
+        'Lat': 52 + i / 100,
+        'Lon': 21 + i / 100,
+        'VehicleNumber': str(i),
+        'Time': f'2021-02-02 17:{i:02d}:27',
+        'Speed': 10.0 * i,
+    } for i in range(10)])
+
+    def test_key(self, tmpdir):
+        self.DATA.to_csv(tmpdir / 'a.csv')
+        self.DATA.to_csv(tmpdir / 'b.csv')
+        cache = PlotDataCache(dirname=tmpdir / 'cache')
+
+        key = cache.key(tmpdir / 'a.csv', 'Speed', (30, 100))
+        assert key == cache.key(tmpdir / 'b.csv', 'Speed', (30, 100))
+        assert key != cache.key(tmpdir / 'a.csv', 'Speed', (0, 100))
+        assert key != cache.key(tmpdir / 'a.csv', 'Delay', (30, 100))
+
+    def test_get_put(self, tmpdir):
+        cache = PlotDataCache(dirname=tmpdir / 'cache')
+
+        assert cache.get('foo') is None
+        cache.put('foo', self.DATA)
+        assert (cache.get('foo') == self.DATA).all(axis=None)
+
+    def test_eviction(self, tmpdir):
+        cache = PlotDataCache(dirname=tmpdir / 'cache')
+        cache.put('foo', self.DATA)
+        cache.max_size = os.path.getsize(tmpdir / 'cache' / 'foo.pkl')
+
+        os.utime(tmpdir / 'cache' / 'foo.pkl', (0, 0))
+        cache.put('bar', self.DATA)
+
+        assert cache.get('foo') is None
+        assert cache.get('bar') is not None
+
+    def test_plotter_hit(self, tmpdir):
+        self.DATA.to_csv(tmpdir / 'speeds.csv')
+        cache = PlotDataCache(dirname=tmpdir / 'cache')
+
+        plotter = WarsawPlotter(filename=tmpdir / 'speeds.csv',
+                                column_name='Speed', bounds=(30, 100),
+                                cache=cache)
+
+        with unittest.mock.patch.object(pd, 'read_csv') as mock:
+            cached = WarsawPlotter(filename=tmpdir / 'speeds.csv',
+                                   column_name='Speed', bounds=(30, 100),
+                                   cache=cache)
+            mock.assert_not_called()
+
+        assert (cached.data == plotter.data).all(axis=None)
+
+
+class TestLivePlotter:
+    @staticmethod
+    def read(tmpdir, filename):
+        with open(tmpdir / filename) as file:
+            return json.load(file)
+
+    def test_write_page(self, tmpdir):
+        plotter = LivePlotter(dirname=tmpdir, column_name='Speed', interval=5)
+        plotter.write_page(filename='index.html', title='foo', size=5,
+                           opacity=0.9, colorscale='speed')
+
+        with open(tmpdir / 'index.html') as file:
+            page = file.read()
+        assert 'snapshot.json' in page
+        assert 'setTimeout(poll, applied ? 0 : 5000)' in page
+
+    def test_publish(self, tmpdir):
+        data = pd.DataFrame([{
+            'VehicleNumber': str(i),
+            'Lat': 52 + i / 100,
+            'Lon': 21 + i / 100,
+            'Speed': 10.0 * i,
+        } for i in range(3)])
+
+        plotter = LivePlotter(dirname=tmpdir, column_name='Speed',
+                              snapshot_every=2)
+        delta = plotter.publish(data)
+        assert len(delta['changed']) == 3
+        assert self.read(tmpdir, 'snapshot.json')['sequence'] == 1
+
+        data.loc[1, 'Speed'] = float('nan')
+        delta = plotter.publish(data.drop(index=2))
+        assert delta == {'sequence': 2, 'changed': {'1': [52.01, 21.01, None]},
+                         'removed': ['2']}
+        assert self.read(tmpdir, 'delta_00000002.json') == delta
+        assert self.read(tmpdir, 'snapshot.json')['sequence'] == 1
+
+        for _ in range(3):
+            delta = plotter.publish(data)
+        assert delta['changed'] == {}
+        assert self.read(tmpdir, 'snapshot.json') == {
+            'sequence': 5,
+            'state': plotter.state,
+        }
+        # deltas older than the previous snapshot are removed
+        assert sorted(name for name in os.listdir(tmpdir)
+                      if name.startswith('delta')) == [
+            f'delta_0000000{i}.json' for i in range(2, 6)
+        ]
+
+    def test_restart(self, tmpdir):
+        data = pd.DataFrame([{
+            'VehicleNumber': str(i),
+            'Lat': 52 + i / 100,
+            'Lon': 21 + i / 100,
+            'Speed': 10.0 * i,
+        } for i in range(3)])
+
+        plotter = LivePlotter(dirname=tmpdir, column_name='Speed',
+                              snapshot_every=2)
+        for _ in range(4):
+            plotter.publish(data)
+
+        restarted = LivePlotter(dirname=tmpdir, column_name='Speed',
+                                snapshot_every=2)
+        delta = restarted.publish(data.drop(index=2))
+        # pages waiting for the next delta reset to the new snapshot
+        assert delta['sequence'] == 5
+        assert self.read(tmpdir, 'snapshot.json') == {
+            'sequence': 5,
+            'state': restarted.state,
+        }
+        assert not [name for name in os.listdir(tmpdir)
+                    if name.startswith('delta')]
+
+        restarted.publish(data)
+        assert self.read(tmpdir, 'delta_00000006.json')['changed'] == {
+            '2': [52.02, 21.02, 20.0],
+        }